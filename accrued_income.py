@@ -130,9 +130,7 @@ class Calculator:
                 warnings.warn(f'{settlement_date}, {units} x {gilt.short_name()}, {div}: using calculated accrued_interest of {accrued_interest}\n')
 
             # Shift holding adjustments by 7 business days to account for ex-dividend period
-            cum_div_date = settlement_date
-            for i in range(7):
-                cum_div_date = ukcalendar.next_business_day(cum_div_date)
+            cum_div_date = ukcalendar.add_business_days(settlement_date, 7)
 
             self.events.append(Event(cum_div_date, isin, Kind.TRADE, units=units))
             self.events.append(Event(settlement_date, isin, Kind.ACCRUED_INTEREST, units=units, accrued_interest=accrued_interest))
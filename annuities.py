@@ -7,11 +7,16 @@
 
 import datetime
 
-from data import mortality
+import numpy as np
+
+from data import boe, mortality
 
 
 cur_year = datetime.datetime.now(datetime.timezone.utc).year
 
+# Payments stop at this age
+max_age = 120
+
 
 def escalation_level(years):
     return 1.0
@@ -26,33 +31,45 @@ def escalation_fixed(rate):
 def escalation_deferred(delay):
     def decorate(fn):
         def escalation(years):
-            return 0.0 if years < delay else fn(years - delay)
+            return np.where(years < delay, 0.0, fn(np.maximum(years - delay, 0)))
+        return escalation
     return decorate
 
 
 # https://en.wikipedia.org/wiki/Actuarial_present_value
-def present_value(cur_age, yield_curve, table:mortality.Table, escalation=escalation_level):
-    yob = cur_year - cur_age
-
-    ages = list(range(cur_age, 121))
-
-    p = 1.0
-    pv = 0.0
-    for age in ages:
-        years = age - cur_age
-        index = float(years)
-        index = max(index,  0.5)
-        index = min(index, 40.0)
-        pay = escalation(years)
-        rate = yield_curve(index)
-        if False:
-            print(f'{years:2d}  {rate:6.2%}  {p:7.2%}')
-        pv += pay * p * (1.0 + rate)**-years
-        qx = table.mortality(yob + age, age)
-        p *= 1.0 - qx
-    assert p == 0.0
-
-    return pv
+def present_value(cur_age, yield_curve:boe.Curve, table:mortality.Table, escalation=escalation_level):
+    return float(present_values([cur_age], yield_curve, table, escalation)[0])
+
+
+# Present values for many current ages at once
+def present_values(cur_ages, yield_curve:boe.Curve, table:mortality.Table, escalation=escalation_level) -> np.ndarray:
+    cur_ages = np.asarray(cur_ages, dtype=np.int64)
+    assert cur_ages.ndim == 1
+    assert np.all(cur_ages >= table.min_age)
+    assert np.all(cur_ages <= max_age)
+
+    # Payments by current age (rows) and years from now (columns)
+    years = np.arange(0, max_age - cur_ages.min() + 1)
+    ages = cur_ages[:, np.newaxis] + years[np.newaxis, :]
+    paid = ages <= max_age
+
+    # Mortality for each cohort's age and year
+    year_index = np.clip(cur_year + years, table.min_year, table.max_year) - table.min_year
+    age_index = np.minimum(ages, table.max_age) - table.min_age
+    qx = np.where(ages > table.max_age, 1.0, table.array[age_index, year_index[np.newaxis, :]].astype(np.float64))
+
+    # Probability of surviving to each payment
+    p = np.ones_like(qx)
+    np.cumprod(1.0 - qx[:, :-1], axis=1, out=p[:, 1:])
+    assert np.all(p[~paid] == 0.0)
+
+    index = np.clip(years.astype(np.float64), 0.5, 40.0)
+    rate = np.interp(index, yield_curve.xp, yield_curve.yp)
+    discount = (1.0 + rate)**-years
+
+    pay = np.broadcast_to(escalation(years), years.shape)
+
+    return np.sum(np.where(paid, pay * p * discount, 0.0), axis=1)
 
 
 def annuity_rate(cur_age, yield_curve, table:mortality.Table):
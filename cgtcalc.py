@@ -14,19 +14,27 @@
 
 
 import argparse
+import array
+import bisect
 import dataclasses
 import datetime
+import hashlib
+import io
+import itertools
 import math
 import operator
 import os
+import pickle
+import struct
 import sys
+import threading
 import typing
 import warnings
 
 from enum import IntEnum, Enum
 from decimal import Decimal, ROUND_HALF_EVEN, ROUND_CEILING, ROUND_FLOOR
 
-from environ import get_version
+from environ import get_version, spawn_executor
 from tax.uk import TaxYear
 from report import Report, TextReport, HtmlReport, PdfReport
 
@@ -132,22 +140,25 @@ allowances = {
 }
 
 
+# Quantization exponents for dround(), indexed by decimal places
+_quantums = [Decimal((0, (1,), -places)) for places in range(8)]
+
+
 # Round if necessary, but don't quantitize if not
 def dround(d:Decimal, places:int=0, rounding:str|None=None) -> Decimal:
     assert isinstance(d, Decimal)
-    _, _, exponent = d.as_tuple()
-    assert isinstance(exponent, (int, str))
+    exponent = d.as_tuple().exponent
     if isinstance(exponent, str):
         return d
     elif exponent > 0:
         # Avoid exponential notation for integers
-        q = Decimal((0, (1,), 0))
-        return d.quantize(q, rounding=rounding)
+        return d.quantize(_quantums[0], rounding=rounding)
     elif exponent >= -places:
         return d
+    elif places < len(_quantums):
+        return d.quantize(_quantums[places], rounding=rounding)
     else:
-        q = Decimal((0, (1,), -places))
-        return d.quantize(q, rounding=rounding)
+        return d.quantize(Decimal((0, (1,), -places)), rounding=rounding)
 
 
 @dataclasses.dataclass
@@ -222,7 +233,7 @@ class Result:
             just[1] = 'r' # disposals
             rows = []
             for tyr in self.tax_years.values():
-                row = dataclasses.astuple(tyr, tuple_factory=list)
+                row = self.dataclass_to_row(tyr)
                 row[1] = len(row[1]) # disposals
                 rows.append(row)
             report.write_table(rows, header=header, just=just)
@@ -323,12 +334,17 @@ class Result:
             just.append(j)
         return just
 
+    @staticmethod
+    def dataclass_to_row(obj:typing.Any) -> list:
+        # Unlike dataclasses.astuple, don't recurse nor copy
+        return [getattr(obj, field.name) for field in dataclasses.fields(obj)]
+
     def write_table(self, report:Report, data:list, indent:str='') -> None:
         assert data
         obj0 = data[0]
         header = self.dataclass_to_header(obj0)
         just = self.dataclass_to_just(obj0)
-        rows = [list(dataclasses.astuple(obj)) for obj in data]
+        rows = (self.dataclass_to_row(obj) for obj in data)
         report.write_table(rows, header=header, indent=indent, just=just)
 
 
@@ -354,351 +370,709 @@ def update_pool(pool_updates:list[PoolUpdate], pool:Acquisition, trade:Trade, de
     ))
 
 
-class Calculator:
+# Merge same-day buys/sells, as per
+# https://www.gov.uk/hmrc-internal-manuals/capital-gains-manual/cg51560#IDATX33F
+def merge_trades(trades:list[Trade]) -> None:
+    i = 0
+    while i + 1 < len(trades):
+        tr0 = trades[i + 0]
+        tr1 = trades[i + 1]
+        if tr0.date == tr1.date and tr0.kind == tr1.kind and tr0.kind in (Kind.BUY, Kind.SELL):
+            shares0, price0, charges0 = tr0.params
+            shares1, price1, charges1 = tr1.params
+            shares = shares0 + shares1
+            price = (shares0*price0 + shares1*price1) / shares
+            charges = charges0 + charges1
+            params0 = [shares, price, charges]
+            trades[i] = Trade(tr0.date, tr0.kind, params0)
+            trades.pop(i + 1)
+        else:
+            i += 1
 
-    def __init__(self, rounding:bool=True):
-        self.places:int = 0 if rounding else 2
-        self.securities: dict[str, list[Trade]] = {}
 
-    def parse(self, stream:typing.TextIO) -> None:
-        line_no = 0
-        for line in stream:
-            line_no += 1
-            line = line.rstrip()
-            if line.startswith('#'):
-                continue
-            row = line.split()
-            if not row:
-                continue
+@dataclasses.dataclass
+class SecurityState:
+    """Calculation state of a security, allowing to resume calculations as
+    further trades are added.
 
-            try:
-                trade, date_str, security = row[:3]
-                params = [Decimal(field) for field in row[3:]]
+    Later trades can't affect calculations for trades on or before `date`,
+    so only the trades after it need to be calculated again."""
 
-                date = datetime.datetime.strptime(date_str, "%d/%m/%Y").date()
+    date: datetime.date
 
-                # Case-insensitive
-                trade = trade.upper()
+    # All trades, sorted and merged
+    trades: list[Trade]
 
-                if trade in ('B', 'BUY'):
-                    kind = Kind.BUY
-                    if len(params) == 4:
-                        tax = params.pop(3)
-                        params[2] += tax
-                    else:
-                        assert len(params) == 3
-                elif trade in ('S', 'SELL'):
-                    kind = Kind.SELL
-                    # Section 104 rules
-                    if date < datetime.date(2008, 4, 6):
-                        raise NotImplementedError(f'line {line_no}: {trade} {date:%d/%m/%Y} {security}: disposals before 4 April 2008 unsupported; replace earlier trades with BUY for Section 104 holding.\n')
-                    if len(params) == 4:
-                        tax = params.pop(3)
-                        assert not tax
-                    else:
-                        assert len(params) == 3
-                elif trade == 'CAPRETURN':
-                    kind = Kind.CAPRETURN
-                elif trade == 'DIVIDEND':
-                    kind = Kind.DIVIDEND
-                elif trade == 'R':
-                    kind = Kind.RESTRUCTURING
-                    factor = params[0]
-                    if factor >= Decimal(1):
-                        params = [factor, Decimal(1)]
-                    else:
-                        factor = dround(Decimal(1) / factor, 6)
-                        params = [Decimal(1), factor]
-                elif trade == 'SPLIT':
-                    kind = Kind.RESTRUCTURING
-                    factor = params[0]
+    # Section 104 pool and equalisation groups as of `date`
+    pool: Acquisition
+    group1_holding: Decimal
+    group2_holding: Decimal
+
+    # Final Section 104 pool updates and disposals
+    pool_updates: list[PoolUpdate]
+    disposals: list[DisposalResult]
+
+    # Unidentified shares of acquisitions after `date`, when partially
+    # identified with disposals up to `date`
+    unidentified: dict[datetime.date, Decimal]
+
+
+# Bump when the saved state is no longer compatible
+state_format = 1
+
+
+def parse_trades(stream:typing.TextIO) -> typing.Iterator[tuple[str, Trade]]:
+    line_no = 0
+    for line in stream:
+        line_no += 1
+        line = line.rstrip()
+        if line.startswith('#'):
+            continue
+        row = line.split()
+        if not row:
+            continue
+
+        try:
+            trade, date_str, security = row[:3]
+            params = [Decimal(field) for field in row[3:]]
+
+            date = datetime.datetime.strptime(date_str, "%d/%m/%Y").date()
+
+            # Case-insensitive
+            trade = trade.upper()
+
+            if trade in ('B', 'BUY'):
+                kind = Kind.BUY
+                if len(params) == 4:
+                    tax = params.pop(3)
+                    params[2] += tax
+                else:
+                    assert len(params) == 3
+            elif trade in ('S', 'SELL'):
+                kind = Kind.SELL
+                # Section 104 rules
+                if date < datetime.date(2008, 4, 6):
+                    raise NotImplementedError(f'line {line_no}: {trade} {date:%d/%m/%Y} {security}: disposals before 4 April 2008 unsupported; replace earlier trades with BUY for Section 104 holding.\n')
+                if len(params) == 4:
+                    tax = params.pop(3)
+                    assert not tax
+                else:
+                    assert len(params) == 3
+            elif trade == 'CAPRETURN':
+                kind = Kind.CAPRETURN
+            elif trade == 'DIVIDEND':
+                kind = Kind.DIVIDEND
+            elif trade == 'R':
+                kind = Kind.RESTRUCTURING
+                factor = params[0]
+                if factor >= Decimal(1):
                     params = [factor, Decimal(1)]
-                elif trade == 'UNSPLIT':
-                    kind = Kind.RESTRUCTURING
-                    factor = params[0]
-                    params = [Decimal(1), factor]
                 else:
-                    raise NotImplementedError(trade)
+                    factor = dround(Decimal(1) / factor, 6)
+                    params = [Decimal(1), factor]
+            elif trade == 'SPLIT':
+                kind = Kind.RESTRUCTURING
+                factor = params[0]
+                params = [factor, Decimal(1)]
+            elif trade == 'UNSPLIT':
+                kind = Kind.RESTRUCTURING
+                factor = params[0]
+                params = [Decimal(1), factor]
+            else:
+                raise NotImplementedError(trade)
 
-                tr = Trade(date, kind, params)
+            tr = Trade(date, kind, params)
 
-            except BaseException:
-                sys.stderr.write(f"Exception processing line {line_no}: {line}\n")
-                raise
+        except BaseException:
+            sys.stderr.write(f"Exception processing line {line_no}: {line}\n")
+            raise
 
-            trades = self.securities.setdefault(security, [])
-            trades.append(tr)
+        yield security, tr
 
-    def calculate(self) -> Result:
-        result = Result()
 
-        for security, trades in self.securities.items():
-            # Sort
-            trades.sort(key=operator.attrgetter("date", "kind"))
-
-            # Merge same-day buys/sells, as per
-            # https://www.gov.uk/hmrc-internal-manuals/capital-gains-manual/cg51560#IDATX33F
-            i = 0
-            while i + 1 < len(trades):
-                tr0 = trades[i + 0]
-                tr1 = trades[i + 1]
-                if tr0.date == tr1.date and tr0.kind == tr1.kind and tr0.kind in (Kind.BUY, Kind.SELL):
-                    shares0, price0, charges0 = tr0.params
-                    shares1, price1, charges1 = tr1.params
-                    shares = shares0 + shares1
-                    price = (shares0*price0 + shares1*price1) / shares
-                    charges = charges0 + charges1
-                    params0 = [shares, price, charges]
-                    trades[i] = Trade(tr0.date, tr0.kind, params0)
-                    trades.pop(i + 1)
-                else:
-                    i += 1
+#
+# Binary cache of parsed trades, stored next to the trades file, with a
+# column per field:
+# - security index (uint32)
+# - date ordinal (int32)
+# - kind (uint8)
+# - number of parameters (uint8)
+# and, for all parameters, Decimal coefficients (int64) and exponents (int8),
+# so that the parameters are reproduced exactly.
+#
 
-            acquisitions = {}
-            disposals = {}
+trades_cache_magic = b'CGTT'
+trades_cache_format = 1
+_trades_cache_header = struct.Struct('<4sHqq32sII')
 
-            for tr in trades:
-                if tr.kind == Kind.BUY:
-                    shares, price, charges = tr.params
-                    # XXX: We could track acquisition charges separately (and
-                    # round it separately) but coalescing into a single figure
-                    # greatly simplifies things
-                    cost = shares*price + charges
-                    cost = dround(cost, 2, ROUND_HALF_EVEN) # Compensate rounding in unit price
-                    cost = dround(cost, self.places, ROUND_CEILING)
-                    acquisition = Acquisition(cost, shares, shares)
-                    assert tr.date not in acquisitions
-                    acquisitions[tr.date] = acquisition
-                if tr.kind == Kind.SELL:
-                    shares, price, charges = tr.params
-                    proceeds = shares*price
-                    proceeds = dround(proceeds, 2, ROUND_HALF_EVEN) # Compensate rounding in unit price
-                    proceeds = dround(proceeds, self.places, ROUND_FLOOR)
-                    charges = dround(charges, self.places, ROUND_CEILING)
-                    disposal = Disposal(proceeds, charges, shares, shares)
-                    assert tr.date not in disposals
-                    disposals[tr.date] = disposal
-
-            # Same day rule
-            for date, disposal in disposals.items():
-                try:
-                    acquisition = acquisitions[date]
-                except KeyError:
-                    continue
-                identify(disposal, acquisition, Identification.SAME_DAY, date)
 
-            # Bed and Breakfast rule
-            for i in range(len(trades)):
-                tr = trades[i]
-                if tr.kind != Kind.SELL:
-                    continue
-                disposal = disposals[tr.date]
-                if not disposal.unidentified:
-                    continue
-                j = i + 1
-                numerator = Decimal(1)
-                denominator = Decimal(1)
-                for j in range(i, len(trades)):
-                    tr2 = trades[j]
-                    if (tr2.date - tr.date).days > 30:
-                        break
-                    if tr2.kind == Kind.RESTRUCTURING:
-                        n, d = tr2.params
-                        numerator *= n
-                        denominator *= d
-                    if tr2.kind != Kind.BUY:
-                        continue
-                    acquisition = acquisitions[tr2.date]
-                    if not acquisition.unidentified:
-                        continue
-                    identify(disposal, acquisition, Identification.BED_AND_BREAKFAST, tr2.date, numerator, denominator)
-                    if not disposal.unidentified:
-                        break
-
-            pool_updates: list[PoolUpdate] = []
-
-            # Walk trades chronologically:
-            # - pooling unidentified shares into a Section 104 pool
-            # - tracking equalisation group 1 and group 2 shares and acquisitions
-            pool = Acquisition(Decimal(0), Decimal(0), Decimal(0))
-            group1_holding = Decimal(0)
-            group2_holding = Decimal(0)
-            for tr in trades:
-                try:
-                    if tr.kind == Kind.BUY:
-                        acquisition = acquisitions[tr.date]
-                        if acquisition.unidentified:
-                            if acquisition.unidentified == acquisition.shares:
-                                delta_cost = acquisition.cost
-                            else:
-                                delta_cost = dround(acquisition.cost * acquisition.unidentified / acquisition.shares, self.places, ROUND_CEILING)
-                            update_pool(pool_updates, pool, tr,
-                                description=f'Bought {acquisition.shares} shares for £{acquisition.cost}',
-                                delta_cost=delta_cost,
-                                delta_shares=acquisition.unidentified
-                            )
-                        group2_holding += acquisition.shares
-
-                    elif tr.kind == Kind.SELL:
-                        disposal = disposals[tr.date]
-
-                        table = []
-                        table.append(('Disposal proceeds', disposal.proceeds, ''))
-                        if disposal.cost:
-                            table.append(('Disposal costs', -disposal.cost, ''))
-                        for identification in disposal.identifications:
-                            identified, kind, acquisition_date, numerator, denominator = identification
-                            acquisition = acquisitions[acquisition_date]
-                            if kind == Identification.SAME_DAY:
-                                assert numerator == Decimal(1)
-                                assert denominator == Decimal(1)
-                                acquisition_date_desc = 'same day'
-                            else:
-                                assert kind == Identification.BED_AND_BREAKFAST
-                                acquisition_date_desc = f'{acquisition_date} (B&B)'
-                            if numerator != Decimal(1) or denominator != Decimal(1):
-                                restructuring_desc = f' ({numerator}-for-{denominator})'
-                            else:
-                                restructuring_desc = ''
-                            assert identified > Decimal(0)
-                            assert identified <= acquisition.shares
-                            if identified == acquisition.shares:
-                                description = f'Cost of {acquisition.shares}{restructuring_desc} shares acquired on {acquisition_date_desc} for £{acquisition.cost}'
-                                table.append((description, -acquisition.cost, ''))
-                            else:
-                                description = f'Cost of {identified}{restructuring_desc} shares of {acquisition.shares} acquired on {acquisition_date_desc} for £{acquisition.cost}'
-                                cost = dround(acquisition.cost * identified / acquisition.shares, self.places, ROUND_CEILING)
-                                table.append((description, -cost, f'(-{acquisition.cost} × {identified} / {acquisition.shares})'))
-                        if disposal.unidentified:
-                            assert pool.cost >= Decimal(0)
-                            assert pool.shares >= disposal.unidentified
-                            identified = disposal.unidentified
-                            if identified == pool.shares:
-                                description = f'Cost of {pool.shares} shares in S.104 holding for £{pool.cost}'
-                                cost = pool.cost
-                                table.append((description, -cost, ''))
-                            else:
-                                description = f'Cost of {identified} shares of {pool.shares} in S.104 holding for £{pool.cost}'
-                                cost = dround(pool.cost * identified / pool.shares, self.places, ROUND_CEILING)
-                                table.append((description, -cost, f'({-pool.cost} × {identified} / {pool.shares})'))
-                            update_pool(pool_updates, pool, tr,
-                                description=f'Sold {disposal.shares} shares',
-                                delta_shares = -identified,
-                                delta_cost = -cost
-                            )
-
-                        # Assume FIFO for notional distributions and equalisation payments
-                        if group1_holding >= disposal.shares:
-                            group1_holding -= disposal.shares
-                        else:
-                            group2_holding -= disposal.shares - group1_holding
-                            group1_holding = Decimal(0)
-
-                        gain = Decimal(0)
-                        allowable_costs = Decimal(0)
-                        for description, cost, calculation in table:
-                            if calculation:
-                                assert math.isclose(eval(calculation.replace('×', '*')), cost, abs_tol=1.0)
-                            gain += cost
-                            if cost < Decimal(0):
-                                allowable_costs -= cost
-
-                        assert gain == disposal.proceeds - allowable_costs
-
-                        result.add_disposal(DisposalResult(
-                            date=tr.date,
-                            security=security,
-                            shares=disposal.shares,
-                            proceeds=disposal.proceeds,
-                            costs=allowable_costs,
-                            table=table
-                        ))
-
-                    elif tr.kind == Kind.DIVIDEND:
-
-                        reference_holding, income = tr.params
-                        holding = group1_holding + group2_holding
-                        if not (is_close_decimal(reference_holding, holding) or is_close_decimal(reference_holding, pool.shares)):
-                            warnings.warn(f'DIVIDEND {tr.date:%d/%m/%Y} {security}: expected holding of {holding} {security} but {reference_holding} were specified')
-                        assert pool.shares >= holding
-
-                        # https://www.gov.uk/hmrc-internal-manuals/capital-gains-manual/cg57707
-                        # Add notional distribution to the Section 104 pool cost
-                        if not pool.shares:
-                            raise ValueError(f'DIVIDEND {tr.date:%d/%m/%Y} {security}: no shares held on-ex-dividend date')
-                        income = dround(income, self.places, ROUND_CEILING)
+def trades_cache_filename(filename:str) -> str:
+    head, tail = os.path.split(filename)
+    return os.path.join(head, f'.{tail}.cgtcache')
 
-                        update_pool(pool_updates, pool, tr,
-                            description="Notional distribution",
-                            delta_cost=income,
-                        )
 
-                    elif tr.kind == Kind.CAPRETURN:
-                        reference_holding, equalisation = tr.params
-                        if not is_close_decimal(reference_holding, group2_holding):
-                            warnings.warn(f'CAPRETURN {tr.date:%d/%m/%Y} {security}: expected Group 2 holding of {group2_holding} {security} but {reference_holding} was specified')
+def _read_array(typecode:str, data:memoryview, offset:int, length:int) -> tuple[array.array, int]:
+    a = array.array(typecode)
+    size = a.itemsize * length
+    a.frombytes(data[offset:offset + size])
+    if len(a) != length:
+        raise ValueError('truncated')
+    if sys.byteorder != 'little':  # pragma: no cover
+        a.byteswap()
+    return a, offset + size
 
-                        # https://www.gov.uk/hmrc-internal-manuals/capital-gains-manual/cg57705
-                        # Allocate equalisation payments to Group 2 acquisitions in proportion to the remaining holdings
-                        if not pool.shares:
-                            raise ValueError(f'CAPRETURN {tr.date:%d/%m/%Y} {security}: no shares held on-ex-dividend date')
-                        assert pool.cost >= equalisation
 
-                        equalisation = dround(equalisation, self.places, ROUND_FLOOR)
+def _replace_file(filename:str, chunks:typing.Iterable[bytes]) -> None:
+    """Atomically replace a file, ignoring failures."""
 
-                        update_pool(pool_updates, pool, tr,
-                            description="Equalisation payment",
-                            delta_cost = -equalisation,
-                        )
+    head, tail = os.path.split(filename)
+    tmp_filename = os.path.join(head, f'{tail}.{os.getpid()}.{threading.get_native_id()}')
+    try:
+        with open(tmp_filename, 'wb') as stream:
+            for chunk in chunks:
+                stream.write(chunk)
+        os.replace(tmp_filename, filename)
+    except OSError:
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+
+
+def read_trades_cache(filename:str, st:os.stat_result, contents:bytes) -> list[tuple[str, Trade]]|None:
+    """Read the cached trades of a file, given its status and contents, or
+    None if missing or stale."""
+
+    cache_filename = trades_cache_filename(filename)
+    try:
+        with open(cache_filename, 'rb') as stream:
+            data = memoryview(stream.read())
+    except OSError:
+        return None
+
+    try:
+        magic, format_, mtime_ns, size, digest, num_securities, num_trades = _trades_cache_header.unpack_from(data)
+        if magic != trades_cache_magic or format_ != trades_cache_format:
+            return None
+        touched = (mtime_ns, size) != (st.st_mtime_ns, st.st_size)
+        if touched and hashlib.sha256(contents).digest() != digest:
+            return None
+
+        offset = _trades_cache_header.size
+        (names_size,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        securities = bytes(data[offset:offset + names_size]).decode('utf-8').split('\n') if num_securities else []
+        offset += names_size
+        if len(securities) != num_securities:
+            raise ValueError('corrupt securities')
+
+        indices, offset = _read_array('I', data, offset, num_trades)
+        ordinals, offset = _read_array('i', data, offset, num_trades)
+        kinds, offset = _read_array('B', data, offset, num_trades)
+        counts, offset = _read_array('B', data, offset, num_trades)
+        num_params = sum(counts)
+        coefficients, offset = _read_array('q', data, offset, num_params)
+        exponents, offset = _read_array('b', data, offset, num_params)
+        if offset != len(data):
+            raise ValueError('trailing data')
+
+        # Dates and parameters repeat a lot, and are immutable, so share them
+        dates = {ordinal: datetime.date.fromordinal(ordinal) for ordinal in set(ordinals)}
+        values = {value: Decimal(value[0]).scaleb(value[1]) for value in set(zip(coefficients, exponents))}
+        params = [values[value] for value in zip(coefficients, exponents)]
+        kinds_ = {kind.value: kind for kind in Kind}
+
+        trades = []
+        p = 0
+        for index, ordinal, kind, count in zip(indices, ordinals, kinds, counts):
+            trades.append((securities[index], Trade(dates[ordinal], kinds_[kind], params[p:p + count])))
+            p += count
+    except (ValueError, IndexError, KeyError, struct.error) as ex:
+        sys.stderr.write(f'warning: ignoring {cache_filename}: {ex}\n')
+        return None
+
+    if touched:
+        # Don't hash the file again next time
+        header = _trades_cache_header.pack(trades_cache_magic, trades_cache_format, st.st_mtime_ns, st.st_size, digest, num_securities, num_trades)
+        _replace_file(cache_filename, [header, data[_trades_cache_header.size:]])
+
+    return trades
+
+
+def write_trades_cache(filename:str, st:os.stat_result, contents:bytes, trades:list[tuple[str, Trade]]) -> None:
+    """Cache trades parsed from a file, given its status and the contents
+    they were parsed from.  Trades whose parameters can't be
+    encoded exactly aren't cached, nor are caches written to read-only
+    locations."""
+
+    securities:dict[str, int] = {}
+    indices = array.array('I')
+    ordinals = array.array('i')
+    kinds = array.array('B')
+    counts = array.array('B')
+    coefficients = array.array('q')
+    exponents = array.array('b')
+    # Keyed by string, as equal Decimals may differ in exponent
+    values:dict[str, tuple[int, int]] = {}
+    try:
+        for security, tr in trades:
+            indices.append(securities.setdefault(security, len(securities)))
+            ordinals.append(tr.date.toordinal())
+            kinds.append(tr.kind)
+            counts.append(len(tr.params))
+            for param in tr.params:
+                key = str(param)
+                try:
+                    coefficient, exponent = values[key]
+                except KeyError:
+                    exponent = param.as_tuple().exponent
+                    if not isinstance(exponent, int) or (param.is_zero() and param.is_signed()):
+                        return
+                    coefficient = int(param.scaleb(-exponent))
+                    values[key] = coefficient, exponent
+                coefficients.append(coefficient)
+                exponents.append(exponent)
+    except OverflowError:
+        return
+
+    digest = hashlib.sha256(contents).digest()
+    names = '\n'.join(securities).encode('utf-8')
+    header = _trades_cache_header.pack(trades_cache_magic, trades_cache_format, st.st_mtime_ns, st.st_size, digest, len(securities), len(indices))
+    columns = [indices, ordinals, kinds, counts, coefficients, exponents]
+    if sys.byteorder != 'little':  # pragma: no cover
+        for column in columns:
+            column.byteswap()
+
+    _replace_file(trades_cache_filename(filename), [header, struct.pack('<I', len(names)), names] + [column.tobytes() for column in columns])
 
-                        # Move Group 2 shares into Group 1
-                        group1_holding += group2_holding
-                        group2_holding = Decimal(0)
 
-                    elif tr.kind == Kind.RESTRUCTURING:
+class Calculator:
+
+    def __init__(self, rounding:bool=True):
+        self.places:int = 0 if rounding else 2
+        self.securities: dict[str, list[Trade]] = {}
+        self.states: dict[str, SecurityState] = {}
+
+    def parse(self, stream:typing.TextIO) -> None:
+        self.add_trades(parse_trades(stream))
+
+    def parse_file(self, filename:str, cache:bool=True) -> None:
+        """Parse a file with trades, reusing the trades cached next to it
+        from a previous parse, if any."""
+
+        if not cache:
+            with open(filename, 'rt') as stream:
+                self.parse(stream)
+            return
+
+        # Stat before reading, so that a concurrent modification can only
+        # make the cache look stale, and hash and parse the same contents
+        with open(filename, 'rb') as stream:
+            st = os.fstat(stream.fileno())
+            contents = stream.read()
+        trades = read_trades_cache(filename, st, contents)
+        if trades is None:
+            trades = list(parse_trades(io.TextIOWrapper(io.BytesIO(contents), encoding='utf-8')))
+            write_trades_cache(filename, st, contents, trades)
+        self.add_trades(trades)
+
+    def add_trades(self, trades:typing.Iterable[tuple[str, Trade]]) -> None:
+        for security, tr in trades:
+            self.securities.setdefault(security, []).append(tr)
+
+    def calculate(self, max_workers:int|None=1) -> Result:
+        """Calculate all securities.
+
+        Securities are independent of each other, so they can be calculated in
+        a pool of processes by passing max_workers other than 1, where None
+        means as many as there are processors.  Results are merged in the same
+        order regardless."""
 
-                        numerator, denominator = tr.params
+        result = Result()
 
-                        pool.shares    = pool.shares    * numerator / denominator
-                        group1_holding = group1_holding * numerator / denominator
-                        group2_holding = group2_holding * numerator / denominator
+        securities = list(self.states)
+        securities += [security for security in self.securities if security not in self.states]
 
-                        pool_updates.append(PoolUpdate(
-                            date=tr.date,
-                            description=f"{numerator}-for-{denominator} share restructuring",
-                            identified=Decimal('NaN'),
-                            delta_cost=Decimal('NaN'),
-                            pool_shares=pool.shares,
-                            pool_cost=dround(pool.cost, 2),
-                        ))
+        tasks = [(security, self.securities.get(security, []), self.states.get(security)) for security in securities]
+        if len(tasks) <= 1 or max_workers == 1:
+            outcomes = [self.calculate_security(*task) for task in tasks]
+        else:
+            outcomes = self._calculate_securities_parallel(tasks, max_workers)
 
-                    else:  # pragma: no cover
-                        raise NotImplementedError(tr.kind)
+        for security, (state, pool_updates, disposal_results) in zip(securities, outcomes):
+            self.states[security] = state
 
-                except BaseException:
-                    sys.stderr.write(f"Exception calculating trade: {tr}\n")
-                    raise
+            for disposal_result in disposal_results:
+                result.add_disposal(disposal_result)
 
             if pool_updates:
                 result.section104_tables[security] = pool_updates
 
+        # New trades are now part of the securities' state
+        self.securities = {}
+
         result.finalize()
 
         return result
 
+    def _calculate_securities_parallel(self, tasks:list[tuple[str, list[Trade], SecurityState|None]], max_workers:int|None) -> list[tuple[SecurityState, list[PoolUpdate], list[DisposalResult]]]:
+        outcomes = []
+        with spawn_executor(max_workers) as executor:
+            for outcome, caught in executor.map(_calculate_security, itertools.repeat(self.places), *zip(*tasks)):
+                # Re-issue warnings in this process, in order
+                for message, category in caught:
+                    warnings.warn(message, category)
+                outcomes.append(outcome)
+        return outcomes
+
+    def calculate_security(self, security:str, trades:list[Trade], state:SecurityState|None=None) -> tuple[SecurityState, list[PoolUpdate], list[DisposalResult]]:
+        """Calculate a single security, resuming from a prior state if given.
+
+        Returns the new state, and all Section 104 pool updates and disposals."""
+
+        trades = sorted(trades, key=operator.attrgetter("date", "kind"))
+
+        if state is not None and trades and trades[0].date <= state.trades[-1].date:
+            # Trades that don't follow the prior state might affect any
+            # calculation, so start afresh
+            trades = sorted(state.trades + trades, key=operator.attrgetter("date", "kind"))
+            state = None
+
+        merge_trades(trades)
+
+        pool_updates: list[PoolUpdate]
+        disposal_results: list[DisposalResult]
+        unidentified: dict[datetime.date, Decimal]
+        if state is None:
+            history = trades
+            pool = Acquisition(Decimal(0), Decimal(0), Decimal(0))
+            group1_holding = Decimal(0)
+            group2_holding = Decimal(0)
+            pool_updates = []
+            disposal_results = []
+            unidentified = {}
+        else:
+            history = state.trades + trades
+            pool = dataclasses.replace(state.pool)
+            group1_holding = state.group1_holding
+            group2_holding = state.group2_holding
+            pool_updates = list(state.pool_updates)
+            disposal_results = list(state.disposals)
+            unidentified = state.unidentified
+
+            # Only trades after the state need to be calculated
+            trades = history[bisect.bisect_right(history, state.date, key=operator.attrgetter('date')):]
+
+        # Disposals can only be identified with acquisitions up to 30 days
+        # later, so the calculations up to 30 days before the last trade are
+        # final
+        checkpoint_date = history[-1].date - datetime.timedelta(days=30) if history else datetime.date.min
+        checkpoint = None
+
+        acquisitions:dict[datetime.date, Acquisition] = {}
+        disposals:dict[datetime.date, Disposal] = {}
+
+        for tr in trades:
+            if tr.kind == Kind.BUY:
+                shares, price, charges = tr.params
+                # XXX: We could track acquisition charges separately (and
+                # round it separately) but coalescing into a single figure
+                # greatly simplifies things
+                cost = shares*price + charges
+                cost = dround(cost, 2, ROUND_HALF_EVEN) # Compensate rounding in unit price
+                cost = dround(cost, self.places, ROUND_CEILING)
+                # Acquisitions might have been partially identified with disposals prior to the state
+                acquisition = Acquisition(cost, shares, unidentified.get(tr.date, shares))
+                assert tr.date not in acquisitions
+                acquisitions[tr.date] = acquisition
+            if tr.kind == Kind.SELL:
+                shares, price, charges = tr.params
+                proceeds = shares*price
+                proceeds = dround(proceeds, 2, ROUND_HALF_EVEN) # Compensate rounding in unit price
+                proceeds = dround(proceeds, self.places, ROUND_FLOOR)
+                charges = dround(charges, self.places, ROUND_CEILING)
+                disposal = Disposal(proceeds, charges, shares, shares)
+                assert tr.date not in disposals
+                disposals[tr.date] = disposal
+
+        # Same day rule
+        for date, disposal in disposals.items():
+            try:
+                acquisition = acquisitions[date]
+            except KeyError:
+                continue
+            identify(disposal, acquisition, Identification.SAME_DAY, date)
+
+        # Bed and Breakfast rule
+        #
+        # Disposals are identified with acquisitions in the following 30 days,
+        # adjusted by any restructurings from the disposal date (inclusive, as
+        # restructurings are ordered after same day disposals) up to the
+        # acquisition date (exclusive, as restructurings are ordered after same
+        # day acquisitions.)
+        acquisition_dates = list(acquisitions)
+        restructurings = [tr for tr in trades if tr.kind == Kind.RESTRUCTURING]
+        restructuring_dates = [tr.date for tr in restructurings]
+        for date, disposal in disposals.items():
+            if not disposal.unidentified:
+                continue
+            lo = bisect.bisect_right(acquisition_dates, date)
+            hi = bisect.bisect_right(acquisition_dates, date + datetime.timedelta(days=30), lo=lo)
+            r = bisect.bisect_left(restructuring_dates, date)
+            numerator = Decimal(1)
+            denominator = Decimal(1)
+            for acquisition_date in acquisition_dates[lo:hi]:
+                while r < len(restructurings) and restructuring_dates[r] < acquisition_date:
+                    n, d = restructurings[r].params
+                    numerator *= n
+                    denominator *= d
+                    r += 1
+                acquisition = acquisitions[acquisition_date]
+                if not acquisition.unidentified:
+                    continue
+                identify(disposal, acquisition, Identification.BED_AND_BREAKFAST, acquisition_date, numerator, denominator)
+                if not disposal.unidentified:
+                    break
+
+        # Walk trades chronologically:
+        # - pooling unidentified shares into a Section 104 pool
+        # - tracking equalisation group 1 and group 2 shares and acquisitions
+        for tr in trades:
+            if checkpoint is None and tr.date > checkpoint_date:
+                checkpoint = dataclasses.replace(pool), group1_holding, group2_holding, len(pool_updates), len(disposal_results)
+            try:
+                if tr.kind == Kind.BUY:
+                    acquisition = acquisitions[tr.date]
+                    if acquisition.unidentified:
+                        if acquisition.unidentified == acquisition.shares:
+                            delta_cost = acquisition.cost
+                        else:
+                            delta_cost = dround(acquisition.cost * acquisition.unidentified / acquisition.shares, self.places, ROUND_CEILING)
+                        update_pool(pool_updates, pool, tr,
+                            description=f'Bought {acquisition.shares} shares for £{acquisition.cost}',
+                            delta_cost=delta_cost,
+                            delta_shares=acquisition.unidentified
+                        )
+                    group2_holding += acquisition.shares
+
+                elif tr.kind == Kind.SELL:
+                    disposal = disposals[tr.date]
+
+                    table = []
+                    table.append(('Disposal proceeds', disposal.proceeds, ''))
+                    if disposal.cost:
+                        table.append(('Disposal costs', -disposal.cost, ''))
+                    for identification in disposal.identifications:
+                        identified, kind, acquisition_date, numerator, denominator = identification
+                        acquisition = acquisitions[acquisition_date]
+                        if kind == Identification.SAME_DAY:
+                            assert numerator == Decimal(1)
+                            assert denominator == Decimal(1)
+                            acquisition_date_desc = 'same day'
+                        else:
+                            assert kind == Identification.BED_AND_BREAKFAST
+                            acquisition_date_desc = f'{acquisition_date} (B&B)'
+                        if numerator != Decimal(1) or denominator != Decimal(1):
+                            restructuring_desc = f' ({numerator}-for-{denominator})'
+                        else:
+                            restructuring_desc = ''
+                        assert identified > Decimal(0)
+                        assert identified <= acquisition.shares
+                        if identified == acquisition.shares:
+                            description = f'Cost of {acquisition.shares}{restructuring_desc} shares acquired on {acquisition_date_desc} for £{acquisition.cost}'
+                            table.append((description, -acquisition.cost, ''))
+                        else:
+                            description = f'Cost of {identified}{restructuring_desc} shares of {acquisition.shares} acquired on {acquisition_date_desc} for £{acquisition.cost}'
+                            cost = dround(acquisition.cost * identified / acquisition.shares, self.places, ROUND_CEILING)
+                            table.append((description, -cost, f'(-{acquisition.cost} × {identified} / {acquisition.shares})'))
+                    if disposal.unidentified:
+                        assert pool.cost >= Decimal(0)
+                        assert pool.shares >= disposal.unidentified
+                        identified = disposal.unidentified
+                        if identified == pool.shares:
+                            description = f'Cost of {pool.shares} shares in S.104 holding for £{pool.cost}'
+                            cost = pool.cost
+                            table.append((description, -cost, ''))
+                        else:
+                            description = f'Cost of {identified} shares of {pool.shares} in S.104 holding for £{pool.cost}'
+                            cost = dround(pool.cost * identified / pool.shares, self.places, ROUND_CEILING)
+                            table.append((description, -cost, f'({-pool.cost} × {identified} / {pool.shares})'))
+                        update_pool(pool_updates, pool, tr,
+                            description=f'Sold {disposal.shares} shares',
+                            delta_shares = -identified,
+                            delta_cost = -cost
+                        )
+
+                    # Assume FIFO for notional distributions and equalisation payments
+                    if group1_holding >= disposal.shares:
+                        group1_holding -= disposal.shares
+                    else:
+                        group2_holding -= disposal.shares - group1_holding
+                        group1_holding = Decimal(0)
+
+                    gain = Decimal(0)
+                    allowable_costs = Decimal(0)
+                    for description, cost, calculation in table:
+                        if calculation:
+                            assert math.isclose(eval(calculation.replace('×', '*')), cost, abs_tol=1.0)
+                        gain += cost
+                        if cost < Decimal(0):
+                            allowable_costs -= cost
+
+                    assert gain == disposal.proceeds - allowable_costs
+
+                    disposal_results.append(DisposalResult(
+                        date=tr.date,
+                        security=security,
+                        shares=disposal.shares,
+                        proceeds=disposal.proceeds,
+                        costs=allowable_costs,
+                        table=table
+                    ))
+
+                elif tr.kind == Kind.DIVIDEND:
+
+                    reference_holding, income = tr.params
+                    holding = group1_holding + group2_holding
+                    if not (is_close_decimal(reference_holding, holding) or is_close_decimal(reference_holding, pool.shares)):
+                        warnings.warn(f'DIVIDEND {tr.date:%d/%m/%Y} {security}: expected holding of {holding} {security} but {reference_holding} were specified')
+                    assert pool.shares >= holding
+
+                    # https://www.gov.uk/hmrc-internal-manuals/capital-gains-manual/cg57707
+                    # Add notional distribution to the Section 104 pool cost
+                    if not pool.shares:
+                        raise ValueError(f'DIVIDEND {tr.date:%d/%m/%Y} {security}: no shares held on-ex-dividend date')
+                    income = dround(income, self.places, ROUND_CEILING)
+
+                    update_pool(pool_updates, pool, tr,
+                        description="Notional distribution",
+                        delta_cost=income,
+                    )
+
+                elif tr.kind == Kind.CAPRETURN:
+                    reference_holding, equalisation = tr.params
+                    if not is_close_decimal(reference_holding, group2_holding):
+                        warnings.warn(f'CAPRETURN {tr.date:%d/%m/%Y} {security}: expected Group 2 holding of {group2_holding} {security} but {reference_holding} was specified')
+
+                    # https://www.gov.uk/hmrc-internal-manuals/capital-gains-manual/cg57705
+                    # Allocate equalisation payments to Group 2 acquisitions in proportion to the remaining holdings
+                    if not pool.shares:
+                        raise ValueError(f'CAPRETURN {tr.date:%d/%m/%Y} {security}: no shares held on-ex-dividend date')
+                    assert pool.cost >= equalisation
+
+                    equalisation = dround(equalisation, self.places, ROUND_FLOOR)
+
+                    update_pool(pool_updates, pool, tr,
+                        description="Equalisation payment",
+                        delta_cost = -equalisation,
+                    )
+
+                    # Move Group 2 shares into Group 1
+                    group1_holding += group2_holding
+                    group2_holding = Decimal(0)
+
+                elif tr.kind == Kind.RESTRUCTURING:
+
+                    numerator, denominator = tr.params
+
+                    pool.shares    = pool.shares    * numerator / denominator
+                    group1_holding = group1_holding * numerator / denominator
+                    group2_holding = group2_holding * numerator / denominator
+
+                    pool_updates.append(PoolUpdate(
+                        date=tr.date,
+                        description=f"{numerator}-for-{denominator} share restructuring",
+                        identified=Decimal('NaN'),
+                        delta_cost=Decimal('NaN'),
+                        pool_shares=pool.shares,
+                        pool_cost=dround(pool.cost, 2),
+                    ))
+
+                else:  # pragma: no cover
+                    raise NotImplementedError(tr.kind)
+
+            except BaseException:
+                sys.stderr.write(f"Exception calculating trade: {tr}\n")
+                raise
+
+        if checkpoint is None:
+            checkpoint = dataclasses.replace(pool), group1_holding, group2_holding, len(pool_updates), len(disposal_results)
+        checkpoint_pool, checkpoint_group1_holding, checkpoint_group2_holding, checkpoint_pool_updates, checkpoint_disposal_results = checkpoint
+
+        # Track acquisitions after the checkpoint identified with disposals before it
+        checkpoint_unidentified = {}
+        for date, acquisition in acquisitions.items():
+            if date > checkpoint_date:
+                checkpoint_unidentified[date] = unidentified.get(date, acquisition.shares)
+        for date, disposal in disposals.items():
+            if date <= checkpoint_date:
+                for identified, _, acquisition_date, _, _ in disposal.identifications:
+                    if acquisition_date > checkpoint_date:
+                        checkpoint_unidentified[acquisition_date] -= identified
+
+        state = SecurityState(
+            date=checkpoint_date,
+            trades=history,
+            pool=checkpoint_pool,
+            group1_holding=checkpoint_group1_holding,
+            group2_holding=checkpoint_group2_holding,
+            pool_updates=pool_updates[:checkpoint_pool_updates],
+            disposals=disposal_results[:checkpoint_disposal_results],
+            unidentified=checkpoint_unidentified,
+        )
+
+        return state, pool_updates, disposal_results
+
+    def save(self, stream:typing.BinaryIO) -> None:
+        """Save the calculation state, so that it can be resumed with further trades."""
+        pickle.dump((state_format, self.places, self.states, self.securities), stream, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, stream:typing.BinaryIO) -> None:
+        """Load a previously saved calculation state."""
+        format_, places, states, securities = pickle.load(stream)
+        if format_ != state_format:
+            raise ValueError(f'unsupported state format {format_}')
+        if places != self.places:
+            raise ValueError('state calculated with different rounding')
+        self.states = states
+        self.securities = securities
+
+
+def _calculate_security(places:int, security:str, trades:list[Trade], state:SecurityState|None) -> tuple[tuple[SecurityState, list[PoolUpdate], list[DisposalResult]], list[tuple[Warning | str, type[Warning]]]]:
+    calculator = Calculator()
+    calculator.places = places
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        outcome = calculator.calculate_security(security, trades, state)
+    return outcome, [(w.message, w.category) for w in caught]
+
 
 def main() -> None:
     argparser = argparse.ArgumentParser()
     argparser.add_argument('-y', '--tax-year', metavar='TAX_YEAR', default=None, help='tax year in XXXX/YYYY, XX/YY, YYYY, or YY format')
     argparser.add_argument('--rounding', action=argparse.BooleanOptionalAction, default=True, help='(dis)enable rounding to whole pounds')
     argparser.add_argument('--format', choices=['text', 'html', 'pdf'], default='text')
-    argparser.add_argument('filename', nargs='+', metavar='FILENAME', help='file with input trades')
+    argparser.add_argument('-j', '--jobs', metavar='N', type=int, default=1, help='number of processes to calculate securities with (0 for as many as processors)')
+    argparser.add_argument('--cache', action=argparse.BooleanOptionalAction, default=True, help='(dis)enable caching parsed trades next to input files')
+    argparser.add_argument('--state', metavar='FILENAME', default=None, help='file to resume the calculation from, and save it to, so that only new trades need to be given')
+    argparser.add_argument('filename', nargs='*', metavar='FILENAME', help='file with input trades')
     args = argparser.parse_args()
+    if not args.filename and args.state is None:
+        argparser.error('no input trades')
 
     calculator = Calculator(rounding=args.rounding)
+    if args.state is not None and os.path.exists(args.state):
+        with open(args.state, 'rb') as state:
+            try:
+                calculator.load(state)
+            except ValueError as e:
+                argparser.error(f'{args.state}: {e}')
     for filename in args.filename:
-        calculator.parse(open(filename, 'rt'))
-    result = calculator.calculate()
+        calculator.parse_file(filename, cache=args.cache)
+    result = calculator.calculate(max_workers=args.jobs or None)
+    if args.state is not None:
+        with open(args.state, 'wb') as state:
+            calculator.save(state)
 
     if args.tax_year is not None:
         try:
@@ -715,7 +1089,7 @@ def main() -> None:
         report = HtmlReport(stream)
     else:
         assert args.format == 'pdf'
-        root, _ = os.path.splitext(args.filename[0])
+        root, _ = os.path.splitext(args.filename[0] if args.filename else args.state)
         output = root + '.pdf'
         assert output not in args.filename
         report = PdfReport(open(output, 'wb'))
@@ -72,7 +72,7 @@ def get_latest_rpi():
 
 def rpi_hash(rpi_series: RPI):
     assert rpi_series.ref_year == RPI.ref_year
-    return hash(tuple(rpi_series.series))
+    return hash(rpi_series.series.tobytes())
 
 
 @st.cache_data(ttl=30*60, hash_funcs={RPI: rpi_hash}, show_spinner='Getting issued gilts...')
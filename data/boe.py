@@ -137,7 +137,7 @@ class Curve:
 
 def YieldCurve(measure:str) -> Curve:
     assert measure in _measures
-    download('https://lategenxer.github.io/finance/boe-yield-curves.csv', _filename)
+    download('https://lategenxer.github.io/finance/boe-yield-curves.csv', _filename, ttl=3600, stale=True)
     column = f'{measure}_Spot'
     df = pd.read_csv(_filename, header=0, index_col=0, usecols=['Years', column])
     series = df[column]
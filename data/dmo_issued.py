@@ -44,9 +44,9 @@ def parse(parser):
 
 if len(sys.argv) > 1:
     for arg in sys.argv[1:]:
-        parse(Issued._parse_xml(arg))
+        parse(Issued._parse_xml(open(arg, 'rb')))
 else:
-    parse(Issued._download())
+    parse(Issued._parse_xml(open(Issued._download(), 'rb')))
 
 isin_codes = list(entries.keys())
 isin_codes.sort()
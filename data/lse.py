@@ -8,6 +8,7 @@
 #
 
 
+import concurrent.futures
 import csv
 import datetime
 import email.utils
@@ -15,8 +16,10 @@ import logging
 import os.path
 import re
 import requests
+import requests.adapters
 import string
 import sys
+import time
 
 from pprint import pp
 
@@ -24,6 +27,7 @@ from pprint import pp
 __all__ = [
     'lookup_tidm',
     'get_instrument_data',
+    'get_instruments_data',
     'get_latest_gilt_prices',
 ]
 
@@ -109,11 +113,18 @@ _tidm_re = re.compile(r'^https://www\.londonstockexchange\.com/[^/]+/(?P<tidm>[^
 _session = requests.Session()
 
 
+# Overridable for testing
+api_url = 'https://api.londonstockexchange.com'
+
+# Seconds to wait for connection and response
+timeout = 30.0
+
+
 def lookup_tidm(isin:str) -> str:
     logger.info(f'Looking up TIDM of {isin}')
     # https://www.londonstockexchange.com/live-markets/market-data-dashboard/price-explorer
-    url = f'https://api.londonstockexchange.com/api/gw/lse/search?worlds=quotes&q={isin}'
-    r = _session.get(url, headers=_headers, stream=False)
+    url = f'{api_url}/api/gw/lse/search?worlds=quotes&q={isin}'
+    r = _session.get(url, headers=_headers, stream=False, timeout=timeout)
     assert r.ok
 
     obj = r.json()
@@ -130,11 +141,19 @@ def lookup_tidm(isin:str) -> str:
     return tidm
 
 
-def get_instrument_data(tidm:str) -> dict:
+class TransientError(Exception):
+    """Server side errors, which might succeed if retried."""
+
+
+def get_instrument_data(tidm:str, session:requests.Session|None=None) -> dict:
     logger.info(f'Getting {tidm} instrument data')
-    url = f'https://api.londonstockexchange.com/api/gw/lse/instruments/alldata/{tidm}'
-    r = _session.get(url, headers=_headers, stream=False)
+    if session is None:
+        session = _session
+    url = f'{api_url}/api/gw/lse/instruments/alldata/{tidm}'
+    r = session.get(url, headers=_headers, stream=False, timeout=timeout)
     if not r.ok:
+        if r.status_code == 429 or r.status_code >= 500:
+            raise TransientError(f'{tidm}: HTTP {r.status_code}')
         try:
             obj = r.json()
             message = obj['message']
@@ -146,6 +165,41 @@ def get_instrument_data(tidm:str) -> dict:
     return obj
 
 
+def get_instruments_data(tidms:list[str], max_workers:int=8, retries:int=3, backoff:float=0.5) -> dict[str, dict]:
+    """Get the data of many instruments concurrently.
+
+    Requests failing due to time outs, connection or server errors are retried
+    with exponential backoff.  Instruments that still fail are logged and left
+    out of the result, so that callers can make do with partial results."""
+
+    def fetch(tidm:str) -> dict:
+        for attempt in range(retries + 1):
+            try:
+                return get_instrument_data(tidm, session=session)
+            except (requests.ConnectionError, requests.Timeout, TransientError) as ex:
+                if attempt == retries:
+                    raise
+                delay = backoff * 2**attempt
+                logger.warning(f'{ex}; retrying in {delay:.1f}s')
+                time.sleep(delay)
+        raise AssertionError  # pragma: no cover
+
+    result = {}
+    with requests.Session() as session:
+        # Keep a connection per worker
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {tidm: executor.submit(fetch, tidm) for tidm in tidms}
+            for tidm, future in futures.items():
+                try:
+                    result[tidm] = future.result()
+                except Exception as ex:
+                    logger.error(f'Failed to get {tidm} instrument data: {ex}')
+    return result
+
+
 def get_latest_gilt_prices() -> tuple[datetime.datetime, list]:
     '''Get the latest gilt prices with a single request'''
 
@@ -165,8 +219,8 @@ def get_latest_gilt_prices() -> tuple[datetime.datetime, list]:
     }
     headers = _headers.copy()
     headers['content-type'] = 'application/json'
-    url ='https://api.londonstockexchange.com/api/v1/components/refresh'
-    r = _session.post(url, headers=headers, json=payload, stream=False)
+    url = f'{api_url}/api/v1/components/refresh'
+    r = _session.post(url, headers=headers, json=payload, stream=False, timeout=timeout)
     assert r.ok
     # This can create troubles with timezones
     dt = email.utils.parsedate_to_datetime(r.headers['Date'])
@@ -202,11 +256,16 @@ def main() -> None:
     th = ['date', 'isin', 'tidm', 'price']
     w.writerow(th)
 
+    instruments_data = get_instruments_data([item['tidm'] for item in content])
+
     for item in content:
         isin = item['isin']
         tidm = item['tidm']
 
-        data = get_instrument_data(tidm)
+        try:
+            data = instruments_data[tidm]
+        except KeyError:
+            continue
 
         try:
             assert data['tidm'] == tidm
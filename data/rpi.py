@@ -11,6 +11,8 @@ import os.path
 import logging
 import re
 
+import numpy as np
+
 from download import download
 
 
@@ -54,16 +56,35 @@ class RPI:
             self.series, self.release_date = self._load()
         else:
             self.series, self.release_date = self.parse(filename, ignore_date=True)
-        assert self.series
+        assert len(self.series)
         assert self.release_date >= self.last_date()
 
+    @property
+    def series(self) -> np.ndarray:
+        return self._series
+
+    @series.setter
+    def series(self, series) -> None:
+        self._series = np.array(series, dtype=np.float64)
+        self._series.flags.writeable = False
+        # Extrapolated values, keyed by inflation rate
+        self._tails:dict[float, np.ndarray] = {}
+
+    def extend(self, values) -> None:
+        self.series = np.concatenate((self._series, values))
+
     _url = 'https://lategenxer.github.io/finance/rpi-series.csv'
     _filename = os.path.join(os.path.dirname(__file__), 'rpi-series.csv')
 
     @classmethod
     def _load(cls) -> tuple[list[float], datetime.date]:
-        download(RPI._url, cls._filename)
-        return cls.parse(cls._filename)
+        download(RPI._url, cls._filename, ttl=3600, stale=True)
+        try:
+            return cls.parse(cls._filename)
+        except OutOfDateError:
+            # Don't serve a stale copy past the next release
+            download(RPI._url, cls._filename)
+            return cls.parse(cls._filename)
 
     def last_date(self) -> datetime.date:
         months = len(self.series) - 1
@@ -115,7 +136,7 @@ class RPI:
 
     def lookup(self, date:datetime.date) -> float:
         month_idx = self.lookup_index(date)
-        return self.series[month_idx]
+        return float(self.series[month_idx])
 
     # https://www.dmo.gov.uk/media/1sljygul/yldeqns.pdf,
     # Annex B: Method of indexation for index-linked gilts with a 3-month indexation lag
@@ -133,25 +154,52 @@ class RPI:
         assert date.year >= self.ref_year
 
         month_idx = self.lookup_index(date)
-        rpi0 = self.series[month_idx]
+        rpi0 = float(self.series[month_idx])
         if date.day == 1:
             return rpi0
-        rpi1 = self.series[month_idx + 1]
+        rpi1 = float(self.series[month_idx + 1])
 
         return self._interpolate(date, rpi0, rpi1)
 
     def latest(self) -> float:
-        return self.series[-1]
+        return float(self.series[-1])
 
     # https://www.dmo.gov.uk/media/1sljygul/yldeqns.pdf
     # ANNEX A: Estimation of the nominal values of future unknown cash
     # flows on index-linked gilts with an 8-month indexation lag.
     def extrapolate_from_index(self, month_idx:int, inflation_rate:float) -> float:
+        n = len(self._series)
+        if month_idx < n:
+            return float(self._series[month_idx])
+        return float(self._tail(inflation_rate, month_idx + 1 - n)[month_idx - n])
+
+    def extrapolate_from_indices(self, month_idx:np.ndarray, inflation_rate:float) -> np.ndarray:
+        """Vectorized extrapolate_from_index."""
+        month_idx = np.asarray(month_idx, dtype=np.int64)
+        n = len(self._series)
+        if month_idx.size == 0 or month_idx.max() < n:
+            return self._series[month_idx]
+        tail = self._tail(inflation_rate, int(month_idx.max()) + 1 - n)
+        return np.concatenate((self._series, tail))[month_idx]
+
+    def _tail(self, inflation_rate:float, months:int) -> np.ndarray:
+        """Extrapolated values for at least the given number of months past
+        the latest."""
         try:
-            return self.series[month_idx]
-        except IndexError:
-            months = month_idx + 1 - len(self.series)
-            return self.series[-1] * (1 + inflation_rate) ** (months / 12)
+            tail = self._tails[inflation_rate]
+        except KeyError:
+            pass
+        else:
+            if len(tail) >= months:
+                return tail
+        # Grow geometrically, to amortize the cost of extending
+        months = max(months, 2*len(self._tails.get(inflation_rate, ())), 12*50)
+        # Python's pow, as NumPy's might differ in the last bit
+        latest = float(self._series[-1])
+        tail = np.array([latest * (1 + inflation_rate) ** (k / 12) for k in range(1, months + 1)])
+        tail.flags.writeable = False
+        self._tails[inflation_rate] = tail
+        return tail
 
     def extrapolate(self, date:datetime.date, inflation_rate:float) -> float:
         month_idx = self.lookup_index(date)
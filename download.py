@@ -6,11 +6,15 @@
 #
 
 
+import contextlib
+import hashlib
 import logging
+import json
 import os.path
 import posixpath
 import shutil
 import sys
+import tempfile
 import time
 import threading
 import urllib.error
@@ -19,19 +23,153 @@ import email.message
 import email.utils
 import http
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Windows
+    fcntl = None  # type: ignore[assignment]
+
 
 __all__ = [
     'download',
+    'wait',
 ]
 
 
 logger = logging.getLogger('download')
 
 
-def download(url:str, filename:str|None=None, ttl:int=0, content_type:str|None=None, verbose:bool=False) -> None:
+# Seconds to wait for the server
+timeout = 60.0
+
+
+def _metadata_filename(filename:str) -> str:
+    head, tail = os.path.split(filename)
+    return os.path.join(head, f'.{tail}.meta')
+
+
+def _load_metadata(filename:str, url:str) -> dict:
+    """Load the validators and the time of the last check of a previously
+    downloaded file."""
+    try:
+        with open(_metadata_filename(filename), 'rt') as stream:
+            metadata = json.load(stream)
+    except FileNotFoundError:
+        return {}
+    except ValueError as ex:
+        logger.warning(f'{filename}: {ex}')
+        return {}
+    if not isinstance(metadata, dict) or metadata.get('url') != url:
+        return {}
+    return metadata
+
+
+def _save_metadata(filename:str, metadata:dict) -> None:
+    # Stamp on completion, so that anybody waiting on us knows they don't
+    # need to check again
+    metadata['checked'] = time.time()
+    metadata_filename = _metadata_filename(filename)
+    tid = threading.get_native_id()
+    tmp_filename = f'{metadata_filename}.{os.getpid()}.{tid}'
+    with open(tmp_filename, 'wt') as stream:
+        json.dump(metadata, stream)
+    os.replace(tmp_filename, metadata_filename)
+
+
+def _checked(filename:str, url:str) -> float:
+    """Time when the copy was last downloaded or validated."""
+    metadata = _load_metadata(filename, url)
+    return metadata.get('checked', os.path.getmtime(filename))
+
+
+# Directory for lock files, shared by all processes of the same user.
+# Lock files can't be safely removed after use, so they are kept here rather
+# than alongside the downloaded files.
+lock_dir = os.path.join(tempfile.gettempdir(), f'download-{os.getuid()}' if hasattr(os, 'getuid') else 'download')
+
+
+_locks:dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _single_flight(filename:str):
+    """Serialize downloads into the same file, among threads and among
+    processes, via a lock file keyed by the file's absolute path."""
+    with _locks_lock:
+        lock = _locks.setdefault(filename, threading.Lock())
+    with lock:
+        os.makedirs(lock_dir, exist_ok=True)
+        digest = hashlib.sha256(filename.encode('utf-8')).hexdigest()
+        with open(os.path.join(lock_dir, f'{digest}.lock'), 'ab') as stream:
+            if fcntl is not None:
+                # Released when closed
+                fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+            yield
+
+
+_revalidations:dict[str, threading.Thread] = {}
+_revalidations_lock = threading.Lock()
+
+
+def download(url:str, filename:str|None=None, ttl:int=0, content_type:str|None=None, verbose:bool=False, stale:bool=False) -> None:
+    """Download url into filename, unless a copy checked less than ttl
+    seconds ago already exists.
+
+    Copies are revalidated with conditional requests, using the ETag and
+    Last-Modified headers saved alongside.  When stale is true an expired
+    copy is returned immediately, and revalidated in the background."""
+
     if filename is None:
         filename = posixpath.basename(url)
+    filename = os.path.abspath(filename)
+
+    start = time.time()
+    if os.path.exists(filename):
+        if _checked(filename, url) + ttl >= start:
+            return
+        if stale:
+            with _revalidations_lock:
+                if filename not in _revalidations:
+                    thread = threading.Thread(target=_revalidate, args=(url, filename, content_type, start), name=f'download {url}')
+                    _revalidations[filename] = thread
+                    thread.start()
+            return
+
+    _download_once(url, filename, content_type, verbose, start)
+
+
+def wait() -> None:
+    """Wait for all background revalidations to complete."""
+    while True:
+        with _revalidations_lock:
+            threads = list(_revalidations.values())
+        if not threads:
+            return
+        for thread in threads:
+            thread.join()
+
 
+def _revalidate(url:str, filename:str, content_type:str|None, start:float) -> None:
+    try:
+        _download_once(url, filename, content_type, False, start)
+    except Exception as ex:
+        # Keep serving the stale copy
+        logger.warning(f'{url}: {ex}')
+    finally:
+        with _revalidations_lock:
+            del _revalidations[filename]
+
+
+def _download_once(url:str, filename:str, content_type:str|None, verbose:bool, start:float) -> None:
+    with _single_flight(filename):
+        # Somebody else might have downloaded or validated it while we waited
+        if os.path.exists(filename) and _checked(filename, url) >= start:
+            return
+        _download(url, filename, content_type, verbose)
+
+
+def _download(url:str, filename:str, content_type:str|None=None, verbose:bool=False) -> None:
     headers = {
         'User-Agent': 'Mozilla/5.0',
     }
@@ -42,16 +180,23 @@ def download(url:str, filename:str|None=None, ttl:int=0, content_type:str|None=N
     if dst_exists:
         dst_size = os.path.getsize(filename)
         dst_mtime = os.path.getmtime(filename)
-        if dst_mtime + ttl >= time.time():
-            return
-        headers['If-Modified-Since'] = time.strftime('%a, %d %b %Y %H:%M:%S %Z', time.gmtime(dst_mtime))
+        metadata = _load_metadata(filename, url)
+        try:
+            headers['If-None-Match'] = metadata['etag']
+        except KeyError:
+            pass
+        headers['If-Modified-Since'] = metadata.get('last_modified', email.utils.formatdate(dst_mtime, usegmt=True))
+    else:
+        metadata = {}
 
     request = urllib.request.Request(url, headers=headers)
 
     try:
-        src = urllib.request.urlopen(request)
+        src = urllib.request.urlopen(request, timeout=timeout)
     except urllib.error.HTTPError as ex:
-        if ex.code == http.HTTPStatus.NOT_MODIFIED:
+        if ex.code == http.HTTPStatus.NOT_MODIFIED and dst_exists:
+            metadata['url'] = url
+            _save_metadata(filename, metadata)
             return
         else:
             raise
@@ -73,10 +218,18 @@ def download(url:str, filename:str|None=None, ttl:int=0, content_type:str|None=N
             logger.warning(f'{url}: unexpected content-type {src_content_type}')
             raise ValueError(f'Expected {content_type}, got {src_content_type}')
 
+    metadata = {
+        'url': url,
+    }
+    etag = src.headers.get('ETag')
+    if etag is not None:
+        metadata['etag'] = etag
+
     src_mtime = src.headers.get('Last-Modified')
     if src_mtime is None:
         src_mtime = time.time()
     else:
+        metadata['last_modified'] = src_mtime
         src_mtime = email.utils.parsedate_tz(src_mtime)
         src_mtime = email.utils.mktime_tz(src_mtime)
 
@@ -86,18 +239,20 @@ def download(url:str, filename:str|None=None, ttl:int=0, content_type:str|None=N
             src_size = int(src_size)
             if src_size == dst_size and src_mtime == dst_mtime:
                 src.close()
+                _save_metadata(filename, metadata)
                 return
 
     logger.info(f'Downloading {url} to {os.path.relpath(filename)}')
     head, tail = os.path.split(filename)
     tid = threading.get_native_id()
-    tmp_filename = os.path.join(head, f'.{tail}.{tid}')
+    tmp_filename = os.path.join(head, f'.{tail}.{os.getpid()}.{tid}')
     dst = open(tmp_filename, 'wb')
     shutil.copyfileobj(src, dst)
     dst.close()
     os.utime(tmp_filename, (src_mtime, src_mtime))
     src.close()
     os.replace(tmp_filename, filename)
+    _save_metadata(filename, metadata)
 
 
 if __name__ == '__main__':
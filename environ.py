@@ -3,6 +3,8 @@
 #
 
 
+import concurrent.futures
+import multiprocessing
 import os.path
 import subprocess
 
@@ -13,6 +15,16 @@ ci: bool = os.environ.get('CI', 'false').lower() == 'true'
 production: bool = int(os.environ.get('PRODUCTION', '0')) != 0
 
 
+# Optional directory for persisting Retirement Tax Planner results
+rtp_cache_dir: str|None = os.environ.get('RTP_CACHE_DIR') or None
+
+
+def spawn_executor(max_workers:int|None=None) -> concurrent.futures.ProcessPoolExecutor:
+    # Don't fork, as the caller might be multi-threaded (e.g., Streamlit)
+    mp_context = multiprocessing.get_context('spawn')
+    return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+
 def get_version() -> str:
     try:
         version = subprocess.check_output([
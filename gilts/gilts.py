@@ -5,14 +5,20 @@
 #
 
 
+import bisect
 import csv
 import datetime
+import functools
+import hashlib
+import io
 import logging
 import numbers
 import operator
 import os.path
+import pickle
 import re
 import sys
+import threading
 
 import xml.etree.ElementTree
 
@@ -23,10 +29,13 @@ from download import download
 
 import scipy.optimize as optimize  # type: ignore[import-untyped]
 
+import numpy as np
 import pandas as pd
 
+import ukcalendar
+
 from xirr import xnpv, xirr
-from ukcalendar import prev_business_day, next_business_day, days_in_month, shift_month
+from ukcalendar import add_business_days, next_business_day, days_in_month, shift_month
 from data import lse
 from data.tidm import load as load_tidms
 
@@ -62,32 +71,52 @@ class Gilt:
     # dmo-D1A.xml's CURRENT_EX_DIV_DATE attribute.
     min_coupon_days = 60
 
-    def coupon_dates(self, settlement_date):
-        assert settlement_date >= self.issue_date
-        assert settlement_date <= self.maturity
-        next_coupon_dates = []
-        prev_coupon_date = self.maturity
+    @functools.cached_property
+    def _schedule(self):
+        # Full coupon calendar in ascending order, starting with the notional
+        # coupon date that precedes the first dividend period, together with
+        # the matching ex-dividend dates.
+        coupon_dates = []
         periods = 0
-        while (prev_coupon_date - self.issue_date).days >= self.min_coupon_days:
-            next_coupon_dates.append(prev_coupon_date)
-            periods += 1
-            prev_coupon_date = shift_month(self.maturity, -6*periods)
-            if prev_coupon_date < settlement_date:
+        coupon_date = self.maturity
+        while True:
+            coupon_dates.append(coupon_date)
+            if (coupon_date - self.issue_date).days < self.min_coupon_days:
                 break
-            prev_coupon_date = shift_month(self.maturity, -6*periods)
-        next_coupon_dates.reverse()
-        return prev_coupon_date, next_coupon_dates
+            periods += 1
+            coupon_date = shift_month(self.maturity, -6*periods)
+        coupon_dates.reverse()
+        xd_dates = [self.ex_dividend_date(coupon_date) for coupon_date in coupon_dates]
+        return coupon_dates, xd_dates
+
+    def _next_coupon_index(self, settlement_date):
+        assert settlement_date >= self.issue_date
+        assert settlement_date <= self.maturity
+        coupon_dates, _ = self._schedule
+        return bisect.bisect_left(coupon_dates, settlement_date, lo=1)
+
+    def coupon_dates(self, settlement_date):
+        i = self._next_coupon_index(settlement_date)
+        coupon_dates, _ = self._schedule
+        return coupon_dates[i - 1], coupon_dates[i:]
 
     def prev_next_coupon_date(self, settlement_date):
-        prev_coupon_date, next_coupon_dates = self.coupon_dates(settlement_date=settlement_date)
-        return prev_coupon_date, next_coupon_dates[0]
+        i = self._next_coupon_index(settlement_date)
+        coupon_dates, _ = self._schedule
+        return coupon_dates[i - 1], coupon_dates[i]
+
+    def _prev_next_coupon_xd_date(self, settlement_date):
+        i = self._next_coupon_index(settlement_date)
+        coupon_dates, xd_dates = self._schedule
+        return coupon_dates[i - 1], coupon_dates[i], xd_dates[i]
 
     @staticmethod
     def ex_dividend_date(coupon_date):
-        xd_date = coupon_date
-        for i in range(7):
-            xd_date = prev_business_day(xd_date)
-        return xd_date
+        return add_business_days(coupon_date, -7)
+
+    def final_ex_dividend_date(self):
+        _, xd_dates = self._schedule
+        return xd_dates[-1]
 
     def _period(self, prev_coupon_date):
         if (prev_coupon_date - self.issue_date).days >= self.min_coupon_days:
@@ -101,14 +130,13 @@ class Gilt:
     # https://docs.londonstockexchange.com/sites/default/files/documents/calculator.xls
     # https://docs.londonstockexchange.com/sites/default/files/documents/accrued-interest-gilts.pdf
     def accrued_interest(self, settlement_date):
-        prev_coupon_date, next_coupon_date = self.prev_next_coupon_date(settlement_date)
+        prev_coupon_date, next_coupon_date, xd_date = self._prev_next_coupon_xd_date(settlement_date)
 
         dividend = self.coupon / 2.0
 
         full_coupon_days = (next_coupon_date - prev_coupon_date).days
 
         assert self.issue_date is not None
-        xd_date = self.ex_dividend_date(next_coupon_date)
 
         period = self._period(prev_coupon_date)
         if period == STANDARD:
@@ -151,14 +179,16 @@ class Gilt:
         return dirty_price - self.accrued_interest(settlement_date=settlement_date)
 
     def cash_flows(self, settlement_date):
-        if settlement_date > self.ex_dividend_date(self.maturity):
+        if settlement_date > self.final_ex_dividend_date():
             return []
 
-        prev_coupon_date, next_coupon_dates = self.coupon_dates(settlement_date=settlement_date)
+        i = self._next_coupon_index(settlement_date)
+        coupon_dates, xd_dates = self._schedule
+        prev_coupon_date, next_coupon_dates = coupon_dates[i - 1], coupon_dates[i:]
 
         transactions = []
 
-        xd_date = self.ex_dividend_date(next_coupon_dates[0])
+        xd_date = xd_dates[i]
         if settlement_date > xd_date:
             prev_coupon_date = next_coupon_dates.pop(0)
         else:
@@ -183,22 +213,21 @@ class Gilt:
 
         return transactions
 
-    def ytm(self, dirty_price, settlement_date):
+    def _ytm_params(self, settlement_date):
         # https://www.dmo.gov.uk/media/1sljygul/yldeqns.pdf , Section 1: price/yield formulae
         # https://www.lseg.com/content/dam/ftse-russell/en_us/documents/ground-rules/ftse-actuaries-uk-gilts-index-series-guide-to-calc.pdf Section 6, Formulae – applying to conventional gilts only
 
-        P = dirty_price
-
-        prev_coupon_date, next_coupon_dates = self.coupon_dates(settlement_date=settlement_date)
-        next_coupon_date = next_coupon_dates[0]
-        n = len(next_coupon_dates) - 1
+        i = self._next_coupon_index(settlement_date)
+        coupon_dates, xd_dates = self._schedule
+        prev_coupon_date, next_coupon_date = coupon_dates[i - 1], coupon_dates[i]
+        n = len(coupon_dates) - 1 - i
 
         c = self.coupon
         f = 2.0
         d1 = c/f
         d2 = c/f
 
-        xd_date = self.ex_dividend_date(next_coupon_date)
+        xd_date = xd_dates[i]
         if settlement_date > xd_date:
             d1 = 0
         else:
@@ -235,7 +264,6 @@ class Gilt:
             logger.debug('xd_date = %s', xd_date)
             logger.debug('prev_coupon_date = %s', prev_coupon_date)
             logger.debug('next_coupon_date = %s', next_coupon_date)
-            logger.debug('P = %f', P)
             logger.debug('n = %i', n)
             logger.debug('c = %f', c)
             logger.debug('d1 = %f', d1)
@@ -243,6 +271,15 @@ class Gilt:
             logger.debug('r = %i', r)
             logger.debug('s = %i', s)
 
+        return n, c, f, d1, d2, r, s
+
+    def ytm(self, dirty_price, settlement_date):
+        P = dirty_price
+
+        n, c, f, d1, d2, r, s = self._ytm_params(settlement_date)
+
+        logger.debug('P = %f', P)
+
         # https://www.dmo.gov.uk/media/1sljygul/yldeqns.pdf Section 1
         if n > 0:
             def fn(v):
@@ -256,6 +293,15 @@ class Gilt:
 
         return y
 
+    def _ytm_terms(self, settlement_date):
+        # Expand the price/yield formula into a sum of discounted cash flows,
+        # P = Σ amounts[k] × v^exponents[k], with v = 1/(1 + y/f)
+        n, c, f, d1, d2, r, s = self._ytm_params(settlement_date)
+        amounts = [d1] + [d2] * min(n, 1) + [c/f] * max(n - 1, 0)
+        amounts[-1] += 100
+        exponents = [k + r/s for k in range(n + 1)]
+        return amounts, exponents, f
+
     def value(self, rate, settlement_date):
         transactions = []
         transactions.append((settlement_date, 0))
@@ -302,6 +348,24 @@ class IndexLinkedGilt(Gilt):
             ref_rpi = self.rpi_series.extrapolate_from_index(month_idx, inflation_rate)
         return round(ref_rpi, 5)
 
+    def ref_rpis(self, settlement_dates, inflation_rate=None):
+        """Vectorized ref_rpi."""
+        lookup_index = self.rpi_series.lookup_index
+        if self.lag == 3:
+            month_idx = np.array([lookup_index(d) for d in settlement_dates], dtype=np.int64)
+            month_idx -= self.lag
+            weight = np.array([(d.day - 1) / days_in_month(d.year, d.month) for d in settlement_dates], dtype=np.float64)
+            rpi0 = self.rpi_series.extrapolate_from_indices(month_idx,     inflation_rate)
+            rpi1 = self.rpi_series.extrapolate_from_indices(month_idx + 1, inflation_rate)
+            ref_rpis = rpi0 + weight * (rpi1 - rpi0)
+        else:
+            assert self.lag == 8
+            month_idx = np.array([lookup_index(self.prev_next_coupon_date(d)[1]) for d in settlement_dates], dtype=np.int64)
+            month_idx -= self.lag
+            ref_rpis = self.rpi_series.extrapolate_from_indices(month_idx, inflation_rate)
+        # Python's round, as NumPy's isn't correctly rounded
+        return np.array([round(ref_rpi, 5) for ref_rpi in ref_rpis.tolist()], dtype=np.float64)
+
     # https://www.dmo.gov.uk/media/1sljygul/yldeqns.pdf
     # Annex B: Method of indexation for index-linked gilts with a 3-month indexation lag
     # When does the redemption payment become known?
@@ -334,6 +398,15 @@ class IndexLinkedGilt(Gilt):
             index_ratio = round(index_ratio, 5)
         return index_ratio
 
+    def index_ratios(self, settlement_dates, inflation_rate=None):
+        """Vectorized index_ratio."""
+        if inflation_rate is None:
+            inflation_rate = self.inflation_rate
+        index_ratios = self.ref_rpis(settlement_dates, inflation_rate=inflation_rate) / self.base_rpi
+        if self.lag == 3:
+            index_ratios = np.array([round(index_ratio, 5) for index_ratio in index_ratios.tolist()], dtype=np.float64)
+        return index_ratios
+
     def dirty_price(self, clean_price, settlement_date):
         # For index-linked gilts with a 3-month indexation lag, the quoted price is the real clean price.
         if self.lag == 3:
@@ -354,8 +427,9 @@ class IndexLinkedGilt(Gilt):
     def cash_flows(self, settlement_date, inflation_rate=None):
         if inflation_rate is None:
             inflation_rate = self.inflation_rate
-        for date, value in Gilt.cash_flows(self, settlement_date=settlement_date):
-            index_ratio = self.index_ratio(date, inflation_rate=inflation_rate)
+        cash_flows = list(Gilt.cash_flows(self, settlement_date=settlement_date))
+        index_ratios = self.index_ratios([date for date, _ in cash_flows], inflation_rate=inflation_rate)
+        for (date, value), index_ratio in zip(cash_flows, index_ratios.tolist()):
             # See https://www.dmo.gov.uk/media/0ltegugd/igcalc.pdf
             # Annex: Rounding Conventions for Interest and Redemption Cash Flows for Index-linked Gilts
             value = round(value * index_ratio, 6 if self.issue_date.year >= 2002 else 4)
@@ -375,33 +449,77 @@ class IndexLinkedGilt(Gilt):
 
         return ytm
 
+    def _ytm_terms(self, settlement_date):
+        # Same as ytm above, i.e., annual compounding with Actual/365.25
+        amounts = []
+        exponents = []
+        for date, value in self.cash_flows(settlement_date=settlement_date):
+            amounts.append(value)
+            exponents.append((date - settlement_date).days / 365.25)
+        return amounts, exponents, 1.0
+
     def short_name(self):
         return f'{self.coupon:.3f}% IL {self.maturity}'
 
 
+@functools.cache
+def _snapshot_version() -> str:
+    """Digest of the sources that determine the parsed gilts, so that any
+    change to them invalidates snapshots."""
+    h = hashlib.sha256()
+    assert ukcalendar.__file__ is not None
+    for filename in (__file__, ukcalendar.__file__, os.path.join(os.path.dirname(ukcalendar.__file__), 'ukbankholidays.csv')):
+        with open(filename, 'rb') as stream:
+            h.update(stream.read())
+    return h.hexdigest()
+
+
 class Issued:
     # https://www.dmo.gov.uk/data/
 
-    def __init__(self, filename=None, rpi_series=None, csv_filename=None):
+    def __init__(self, filename=None, rpi_series=None, csv_filename=None, cache=True):
         if csv_filename is not None:
             assert filename is None
-            entries = self._parse_csv(csv_filename)
+            source, parse = csv_filename, self._parse_csv
         elif filename is None:
-            entries = self._download()
+            source, parse = self._download(), self._parse_xml
         else:
-            entries = self._parse_xml(filename)
+            source, parse = filename, self._parse_xml
 
         self.rpi_series = rpi_series
 
-        self.all = []
+        # Hash and parse the very same bytes, as the file might be replaced
+        # meanwhile (e.g., by a background download)
+        with open(source, 'rb') as stream:
+            data = stream.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        snapshot = self._load_snapshot(source, digest) if cache else None
+        if snapshot is None:
+            self.close_date, self.all = self._parse(parse(io.BytesIO(data)))
+            if cache:
+                self._save_snapshot(source, digest, (self.close_date, self.all))
+        else:
+            self.close_date, self.all = snapshot
+
+        for gilt in self.all:
+            if isinstance(gilt, IndexLinkedGilt):
+                gilt.rpi_series = rpi_series
+
+        self.isin = {gilt.isin: gilt for gilt in self.all}
+
+    @classmethod
+    def _parse(cls, entries):
+        close_date = None
+        gilts = []
         for entry in entries:
             name = entry['INSTRUMENT_NAME']
             kwargs = {
                 'name': name,
                 'isin': entry['ISIN_CODE'],
-                'coupon': self._parse_coupon(name),
-                'maturity': self._parse_date(entry['REDEMPTION_DATE']),
-                'issue_date': self._parse_date(entry['FIRST_ISSUE_DATE']),
+                'coupon': cls._parse_coupon(name),
+                'maturity': cls._parse_date(entry['REDEMPTION_DATE']),
+                'issue_date': cls._parse_date(entry['FIRST_ISSUE_DATE']),
             }
             type_ = entry['INSTRUMENT_TYPE'].rstrip(' ')
             if type_ == 'Conventional':
@@ -412,31 +530,70 @@ class Issued:
                 lag = int(mo.group(1))
                 assert lag == 3 if kwargs['issue_date'] >= datetime.date(2005, 9, 22) else 8
                 kwargs['base_rpi'] = float(entry['BASE_RPI_87'])
-                kwargs['rpi_series'] = rpi_series
+                kwargs['rpi_series'] = None
                 gilt = IndexLinkedGilt(**kwargs)
 
             try:
-                self.close_date = self._parse_date(entry['CLOSE_OF_BUSINESS_DATE'])
+                close_date = cls._parse_date(entry['CLOSE_OF_BUSINESS_DATE'])
             except KeyError:
-                self.close_date = None
+                close_date = None
 
             # Check ex-dividend dates match when testing
             if "PYTEST_CURRENT_TEST" in os.environ:
                 try:
-                    current_xd_date = self._parse_date(entry['CURRENT_EX_DIV_DATE'])
+                    current_xd_date = cls._parse_date(entry['CURRENT_EX_DIV_DATE'])
                 except KeyError:
                     pass
                 else:
                     # DMO seems to determine current/next xd-date from the next calendar day after close
-                    settlement_date = self.close_date + datetime.timedelta(days=1)
+                    assert close_date is not None
+                    settlement_date = close_date + datetime.timedelta(days=1)
                     _, next_coupon_date = gilt.prev_next_coupon_date(settlement_date)
                     assert gilt.ex_dividend_date(next_coupon_date) == current_xd_date
 
-            self.all.append(gilt)
+            # Compute the coupon schedule now, so it gets into the snapshot
+            gilt._schedule
 
-        self.all.sort(key=operator.attrgetter('maturity'))
+            gilts.append(gilt)
 
-        self.isin = {gilt.isin: gilt for gilt in self.all}
+        gilts.sort(key=operator.attrgetter('maturity'))
+
+        return close_date, gilts
+
+    # Parsed gilts are saved in a snapshot next to the source file, keyed by
+    # its digest, as computing coupon schedules is comparatively slow.
+
+    @staticmethod
+    def _snapshot_filename(filename:str) -> str:
+        head, tail = os.path.split(filename)
+        return os.path.join(head, f'.{tail}.issued')
+
+    @classmethod
+    def _load_snapshot(cls, filename:str, source_digest:str):
+        snapshot_filename = cls._snapshot_filename(filename)
+        try:
+            with open(snapshot_filename, 'rb') as stream:
+                version, digest, snapshot = pickle.load(stream)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logger.warning(f'{snapshot_filename}: {ex}')
+            return None
+        if version != _snapshot_version() or digest != source_digest:
+            return None
+        return snapshot
+
+    @classmethod
+    def _save_snapshot(cls, filename:str, source_digest:str, snapshot) -> None:
+        snapshot_filename = cls._snapshot_filename(filename)
+        tid = threading.get_native_id()
+        tmp_filename = f'{snapshot_filename}.{os.getpid()}.{tid}'
+        try:
+            with open(tmp_filename, 'wb') as stream:
+                pickle.dump((_snapshot_version(), source_digest, snapshot), stream, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filename, snapshot_filename)
+        except OSError as ex:
+            logger.warning(f'{snapshot_filename}: {ex}')
 
     @staticmethod
     def _download():
@@ -444,20 +601,19 @@ class Issued:
         # updated daily by .github/workflows/gh-pages.yml to avoid Captchas on
         # more frequent downloads.
         filename = os.path.join(os.path.dirname(__file__), 'dmo-D1A.xml')
-        download('https://lategenxer.github.io/finance/dmo-D1A.xml', filename)
-        return list(Issued._parse_xml(filename))
+        download('https://lategenxer.github.io/finance/dmo-D1A.xml', filename, ttl=3600, stale=True)
+        return filename
 
     @staticmethod
-    def _parse_xml(filename):
-        stream = open(filename, 'rt')
+    def _parse_xml(stream):
         tree = xml.etree.ElementTree.parse(stream)
         root = tree.getroot()
         for node in root:
             yield node.attrib
 
     @staticmethod
-    def _parse_csv(filename):
-        entries = list(csv.DictReader(open(filename, 'rt')))
+    def _parse_csv(stream):
+        entries = list(csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline='')))
         for entry in entries:
             if entry['BASE_RPI_87']:
                 issue_date = Issued._parse_date(entry['FIRST_ISSUE_DATE'])
@@ -511,7 +667,7 @@ class Issued:
             # final dividend and the principal repayment at redemption of the
             # gilt. Trades cannot settle after the final day within the
             # ex-dividend period."
-            if settlement_date is not None and settlement_date > g.ex_dividend_date(g.maturity):
+            if settlement_date is not None and settlement_date > g.final_ex_dividend_date():
                 continue
 
             if index_linked is not None:
@@ -574,10 +730,18 @@ class GiltPrices:
         # LSE prices are delayed 15min
         dt -= datetime.timedelta(minutes=15)
 
+        instruments_data = lse.get_instruments_data([item['tidm'] for item in content])
+        if content and not instruments_data:
+            raise ValueError('failed to get any gilt prices')
+
         for item in content:
             isin = item['isin']
             tidm = item['tidm']
-            data = lse.get_instrument_data(tidm)
+            try:
+                data = instruments_data[tidm]
+            except KeyError:
+                # Already logged
+                continue
             try:
                 assert data['tidm'] == tidm
                 assert data['isin'] == isin
@@ -598,7 +762,7 @@ class GiltPrices:
     @staticmethod
     def _download():
         filename = os.path.join(os.path.dirname(__file__), 'gilts-closing-prices.csv')
-        download('https://lategenxer.github.io/finance/gilts-closing-prices.csv', filename)
+        download('https://lategenxer.github.io/finance/gilts-closing-prices.csv', filename, ttl=3600, stale=True)
         return list(csv.DictReader(open(filename, 'rt')))
 
     def lookup_tidm(self, isin):
@@ -611,22 +775,100 @@ class GiltPrices:
         return self.datetime
 
 
+class GiltBook:
+    '''Batch pricing of many gilts for a common settlement date.
+
+    Coupon schedules are laid out once into padded arrays, so that accrued
+    interest, dirty prices and yields for the whole book are computed with
+    array operations and a single vectorized Newton solve.'''
+
+    def __init__(self, gilts, settlement_date:datetime.date):
+        self.gilts = list(gilts)
+        self.settlement_date = settlement_date
+
+        terms = [g._ytm_terms(settlement_date) for g in self.gilts]
+
+        size = len(self.gilts)
+        width = max([len(amounts) for amounts, _, _ in terms], default=0)
+
+        # Padding entries have zero amounts, hence do not contribute to the
+        # sums nor their derivatives.
+        self._amounts = np.zeros((size, width), dtype=np.float64)
+        self._exponents = np.zeros((size, width), dtype=np.float64)
+        self._frequency = np.zeros(size, dtype=np.float64)
+        for i, (amounts, exponents, f) in enumerate(terms):
+            self._amounts[i, :len(amounts)] = amounts
+            self._exponents[i, :len(exponents)] = exponents
+            self._frequency[i] = f
+
+        self.accrued_interest = np.array([g.accrued_interest(settlement_date) for g in self.gilts], dtype=np.float64)
+
+        # For index-linked gilts with a 3-month indexation lag, the quoted
+        # price is the real clean price.
+        self.index_ratio = np.ones(size, dtype=np.float64)
+        for i, g in enumerate(self.gilts):
+            if isinstance(g, IndexLinkedGilt) and g.lag == 3:
+                self.index_ratio[i] = g.index_ratio(settlement_date)
+
+    def __len__(self):
+        return len(self.gilts)
+
+    def dirty_prices(self, clean_prices):
+        clean_prices = np.asarray(clean_prices, dtype=np.float64)
+        return clean_prices * self.index_ratio + self.accrued_interest
+
+    def clean_prices(self, dirty_prices):
+        dirty_prices = np.asarray(dirty_prices, dtype=np.float64)
+        return (dirty_prices - self.accrued_interest) / self.index_ratio
+
+    def ytm(self, dirty_prices, tol=1.48e-8, maxiter=50):
+        P = np.asarray(dirty_prices, dtype=np.float64)
+        assert P.shape == (len(self.gilts),)
+
+        A = self._amounts
+        E = self._exponents
+        f = self._frequency
+
+        # Solve Σ A×v^E = P for v, on all gilts simultaneously, using the
+        # same starting point as Gilt.ytm
+        v = 1 / (1 + .05 / f)
+        active = np.arange(len(P))
+        for _ in range(maxiter):
+            if not active.size:
+                break
+            va = v[active, np.newaxis]
+            Aa = A[active]
+            Ea = E[active]
+            terms = Aa * va ** Ea
+            fn = terms.sum(axis=1) - P[active]
+            fn_prime = (terms * Ea).sum(axis=1) / va[:, 0]
+            step = fn / fn_prime
+            v[active] -= step
+            active = active[~(np.abs(step) < tol)]
+
+        y = (1 / v - 1) * f
+
+        # Fallback to the scalar solver for whatever did not converge
+        for i in active:
+            logger.warning('%s: vectorized yield did not converge', self.gilts[i].short_name())
+            y[i] = self.gilts[i].ytm(P[i], self.settlement_date)
+
+        return y
+
+
 def yield_curve(issued, prices, index_linked=False):
     settlement_date = next_business_day(issued.close_date)
-    data = []
-    for g in issued.filter(index_linked, settlement_date):
-        isin = g.isin
-        tidm = prices.lookup_tidm(isin)
-        clean_price = prices.get_price(tidm)
-        dirty_price = g.dirty_price(clean_price, settlement_date)
+    book = GiltBook(issued.filter(index_linked, settlement_date), settlement_date)
 
-        ytm = g.ytm(dirty_price, settlement_date)
-        if index_linked:
-            ytm = (1.0 + ytm)/(1.0 + IndexLinkedGilt.inflation_rate) - 1.0
-        ytm *= 100.0
+    tidms = [prices.lookup_tidm(g.isin) for g in book.gilts]
+    clean_prices = [prices.get_price(tidm) for tidm in tidms]
+    dirty_prices = book.dirty_prices(clean_prices)
 
-        maturity = (g.maturity - issued.close_date).days / 365.25
+    ytm = book.ytm(dirty_prices)
+    if index_linked:
+        ytm = (1.0 + ytm)/(1.0 + IndexLinkedGilt.inflation_rate) - 1.0
+    ytm *= 100.0
 
-        data.append((maturity, ytm, tidm))
+    maturity = np.array([(g.maturity - issued.close_date).days for g in book.gilts], dtype=np.float64) / 365.25
 
-    return pd.DataFrame(data, columns=['Maturity', 'Yield', 'TIDM'])
+    return pd.DataFrame({'Maturity': maturity, 'Yield': ytm, 'TIDM': tidms}, columns=['Maturity', 'Yield', 'TIDM'])
@@ -24,7 +24,7 @@ from typing import Any
 
 from xirr import xirr
 from ukcalendar import next_business_day, shift_month, shift_year
-from .gilts import Gilt, IndexLinkedGilt, Issued, GiltPrices
+from .gilts import Gilt, IndexLinkedGilt, Issued, GiltPrices, GiltBook
 from data.rpi import RPI
 
 
@@ -67,6 +67,44 @@ class Description:
         return repr(self.fmt.format(**{k: math.nan if isinstance(v, (lp.LpVariable, lp.LpAffineExpression)) else v for k, v in self.kwargs.items()}))
 
 
+@dataclasses.dataclass
+class Holding:
+    gilt: Gilt
+    tidm: str
+    initial_quantity: typing.Any
+    clean_price: float = math.nan
+    dirty_price: float = math.nan
+    ytm: float = math.nan
+
+
+@dataclasses.dataclass
+class Sale:
+    description: Description
+    holding: Holding
+    date: datetime.date
+    dirty_price: float
+
+
+@dataclasses.dataclass
+class LadderModel:
+    '''Linear program for a ladder, independent of gilt prices.'''
+
+    key: tuple
+    prob: typing.Any
+    settlement_date: datetime.date
+    base_rpi: float
+    yearly_consumption: float
+    transactions: list[tuple[datetime.date, float]]
+    book: GiltBook
+    holdings: list[Holding]
+    sales: list[Sale]
+    initial_cash: typing.Any
+    cash_flows: list[typing.Any]
+    balance: typing.Any
+    accrued_income: typing.Any
+    interest_desc: str
+
+
 class BondLadder:
 
     index_linked = False
@@ -83,8 +121,36 @@ class BondLadder:
         self.buy_df:pd.DataFrame|None = None
         self.cash_flow_df:pd.DataFrame|None = None
         self.today = datetime.datetime.now(datetime.timezone.utc).date()
+        self._model:LadderModel|None = None
 
-    def solve(self):
+    def _gilts(self, settlement_date, last_consuption):
+        gilts = []
+        for g in self.issued.filter(self.index_linked, settlement_date):
+            assert g.maturity > settlement_date
+            # XXX handle this better
+            if g.maturity > shift_month(last_consuption, self.lag):
+                continue
+            gilts.append(g)
+        return gilts
+
+    def _model_key(self):
+        settlement_date = next_business_day(self.today)
+        last_consuption = self.schedule[-1][0]
+        gilts = self._gilts(settlement_date, last_consuption)
+        tidms = tuple(self.prices.lookup_tidm(g.isin) for g in gilts)
+        return (
+            self.today,
+            tuple(tuple(item) for item in self.schedule),
+            self.index_linked,
+            self.marginal_income_tax,
+            self.interest_rate,
+            self.lag,
+            self.rpi_series.last_date(),
+            tuple(g.isin for g in gilts),
+            tidms,
+        ), gilts, tidms
+
+    def _build(self, key, gilts, tidms):
         today = self.today
         date, amount = self.schedule[0]
         yearly_consumption = amount * 365.25 / (date - today).days
@@ -126,39 +192,22 @@ class BondLadder:
                 d = d.replace(year=d.year + 1)
 
         initial_cash = lp.LpVariable('initial_cash', 0)
-        total_cost = initial_cash
 
         settlement_date = next_business_day(today)
 
-        @dataclasses.dataclass
-        class Holding:
-            gilt: Gilt
-            tidm: str
-            clean_price: float
-            dirty_price: float
-            initial_quantity: typing.Any
+        book = GiltBook(gilts, settlement_date)
 
         # Add bond coupon/redemption events
         holdings = []
-        for g in self.issued.filter(self.index_linked, settlement_date):
+        sales = []
+        for i, g in enumerate(gilts):
             maturity = g.maturity
-            assert maturity > settlement_date
-            # XXX handle this better
-            if maturity > shift_month(last_consuption, self.lag):
-                continue
-            isin = g.isin
-            tidm = self.prices.lookup_tidm(isin)
-            clean_price = self.prices.get_price(tidm)
-
-            accrued_interest = g.accrued_interest(settlement_date)
-            dirty_price = g.dirty_price(clean_price, settlement_date)
-            ytm = g.ytm(dirty_price, settlement_date=settlement_date)
+            tidm = tidms[i]
+            accrued_interest = float(book.accrued_interest[i])
 
             quantity = lp.LpVariable(tidm, 0)
-            cost = quantity * dirty_price
-            total_cost = total_cost + cost
 
-            holding = Holding(g, tidm, clean_price, dirty_price, quantity)
+            holding = Holding(g, tidm, quantity)
 
             cash_flows = list(g.cash_flows(settlement_date))
             assert cash_flows
@@ -170,17 +219,17 @@ class BondLadder:
                 if self.lag:
                     while consumption_dates and consumption_dates[0] <= d:
                         cd = consumption_dates.pop(0)
-                        if maturity < shift_month(cd, self.lag) and cd <= g.ex_dividend_date(maturity):
+                        if maturity < shift_month(cd, self.lag) and cd <= g.final_ex_dividend_date():
                             sell = lp.LpVariable(f'Sell_{tidm}_{cd:%Y%m%d}', 0)
                             quantity = quantity - sell
                             prob += quantity >= 0
                             income = income + sell * g.accrued_interest(cd)
-                            ref_dirty_price = g.value(rate=ytm, settlement_date=cd)
                             dirty_price = g.value(rate=0.10, settlement_date=cd)
-                            discount = dirty_price/ref_dirty_price - 1
                             clean_price = g.clean_price(dirty_price, settlement_date=cd)
                             operand = sell * dirty_price, income
-                            description = Description('*** Sell {sell:.2f} × {tidm} @ {clean_price:.2f} ({discount:+.1%}) ***', tidm=tidm, sell=sell, clean_price=clean_price, discount=discount)
+                            # The discount depends on the gilt's yield, so it's filled in when solving
+                            description = Description('*** Sell {sell:.2f} × {tidm} @ {clean_price:.2f} ({discount:+.1%}) ***', tidm=tidm, sell=sell, clean_price=clean_price, discount=math.nan)
+                            sales.append(Sale(description, holding, cd, dirty_price))
                             events.append(Event(cd, description, EventKind.CASH_FLOW, operand))
                             income = 0
 
@@ -287,9 +336,62 @@ class BondLadder:
 
             cash_flows.append(cf)
 
+        assert tax_due is None
+
+        return LadderModel(
+            key=key,
+            prob=prob,
+            settlement_date=settlement_date,
+            base_rpi=base_rpi,
+            yearly_consumption=yearly_consumption,
+            transactions=transactions,
+            book=book,
+            holdings=holdings,
+            sales=sales,
+            initial_cash=initial_cash,
+            cash_flows=cash_flows,
+            balance=balance,
+            accrued_income=accrued_income,
+            interest_desc=interest_desc,
+        )
+
+    def solve(self):
+        # Only the objective depends on the gilt prices, so the model is
+        # reused, with just the objective replaced, when nothing else changed.
+        key, gilts, tidms = self._model_key()
+        model = self._model
+        if model is None or model.key != key:
+            model = self._build(key, gilts, tidms)
+            self._model = model
+            rebuilt = True
+        else:
+            rebuilt = False
+
+        prob = model.prob
+        book = model.book
+        holdings = model.holdings
+        initial_cash = model.initial_cash
+
+        clean_prices = [self.prices.get_price(h.tidm) for h in holdings]
+        dirty_prices = book.dirty_prices(clean_prices)
+        ytms = book.ytm(dirty_prices)
+
+        costs = [initial_cash]
+        for h, clean_price, dirty_price, ytm in zip(holdings, clean_prices, dirty_prices, ytms):
+            h.clean_price = clean_price
+            h.dirty_price = float(dirty_price)
+            h.ytm = float(ytm)
+            costs.append(h.initial_quantity * h.dirty_price)
+        total_cost = lp.lpSum(costs)
+
+        for sale in model.sales:
+            ref_dirty_price = sale.holding.gilt.value(rate=sale.holding.ytm, settlement_date=sale.date)
+            sale.description.kwargs['discount'] = sale.dirty_price/ref_dirty_price - 1
+
         prob.setObjective(total_cost)
 
-        prob.checkDuplicateVars()
+        if rebuilt:
+            prob.checkDuplicateVars()
 
         solvers = lp.listSolvers(onlyAvailable=True)
         if 'PULP_CBC_CMD' in solvers:
@@ -302,10 +404,9 @@ class BondLadder:
         assert status == lp.LpStatusOptimal
 
         # There should be no cash left, barring rounding errors
-        assert lp.value(balance) < 1.0
+        assert lp.value(model.balance) < 1.0
 
-        assert tax_due is None
-        assert not self.marginal_income_tax or lp.value(accrued_income) < 0.01
+        assert not self.marginal_income_tax or lp.value(model.accrued_income) < 0.01
 
         total_cost = lp.value(total_cost)
 
@@ -313,7 +414,7 @@ class BondLadder:
         for h in holdings:
             quantity = lp.value(h.initial_quantity)
             g = h.gilt
-            ytm = g.ytm(h.dirty_price, settlement_date=settlement_date)
+            ytm = h.ytm
             if self.index_linked:
                 ytm = (1.0 + ytm)/(1.0 + IndexLinkedGilt.inflation_rate) - 1.0
             buy_rows.append({
@@ -338,18 +439,22 @@ class BondLadder:
         self.cost = total_cost
 
         # Use real values
+        interest_desc = model.interest_desc
         data = []
         prev_cf = None
-        for cf in cash_flows:
-            cf.description = str(cf.description)
+        for cf in model.cash_flows:
             if self.index_linked:
-                index_ratio = base_rpi / self.rpi_series.extrapolate(cf.date, IndexLinkedGilt.inflation_rate)
+                index_ratio = model.base_rpi / self.rpi_series.extrapolate(cf.date, IndexLinkedGilt.inflation_rate)
             else:
                 index_ratio = 1.0
-            cf.incoming = index_ratio * lp.value(cf.incoming)
-            cf.outgoing = index_ratio * lp.value(cf.outgoing)
-            cf.balance  = index_ratio * lp.value(cf.balance)
-            cf.income   = index_ratio * lp.value(cf.income)
+            # Leave the model's cash flows untouched so they can be evaluated again
+            cf = dataclasses.replace(cf,
+                description = str(cf.description),
+                incoming = index_ratio * lp.value(cf.incoming),
+                outgoing = index_ratio * lp.value(cf.outgoing),
+                balance  = index_ratio * lp.value(cf.balance),
+                income   = index_ratio * lp.value(cf.income),
+            )
 
             # Filter out zero flows
             if cf.incoming <= .005:
@@ -386,9 +491,9 @@ class BondLadder:
 
         self.cash_flow_df = df
 
-        self.withdrawal_rate = yearly_consumption/total_cost
+        self.withdrawal_rate = model.yearly_consumption/total_cost
 
-        transactions.append((settlement_date, -total_cost))
+        transactions = model.transactions + [(model.settlement_date, -total_cost)]
 
         transactions.sort(key=operator.itemgetter(0))
 
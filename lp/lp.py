@@ -13,24 +13,34 @@ Wrapper around scipy.optimize.linprog with similar interface to PuLP.
 
 from __future__ import annotations
 
+import itertools
 import operator
 import time
 import warnings
 import sys
 
+from array import array
+
 import numpy as np
 
-from scipy.sparse import csr_array  # type: ignore[import-untyped]
+from scipy.sparse import coo_array  # type: ignore[import-untyped]
 from scipy.optimize import linprog  # type: ignore[import-untyped]
 
 
+# Variables are numbered on creation, so that problems can record their
+# coefficients as they are added, with no dictionary lookups when solving.
+_variable_counter = itertools.count()
+
+
 class LpVariable:
 
+    __slots__ = ('name', '_lbound', '_ubound', '_index', '_value')
+
     def __init__(self, name, lbound=None, ubound=None):
         self.name = name
         self._lbound = lbound
         self._ubound = ubound
-        self._index:int|None = None
+        self._index:int = next(_variable_counter)
         self._value:float|None = None
 
     def __str__(self):
@@ -40,7 +50,7 @@ class LpVariable:
         return self.name
 
     def _affine(self):
-        return LpAffineExpression({self: 1.0}, 0.0)
+        return LpAffineExpression._new({self: 1.0}, 0.0)
 
     def __add__(self, other):
         return self._affine() + other
@@ -55,7 +65,7 @@ class LpVariable:
         return other - self._affine()
 
     def __neg__(self):
-        return LpAffineExpression({self: -1.0}, 0.0)
+        return LpAffineExpression._new({self: -1.0}, 0.0)
 
     def __mul__(self, other):
         return self._affine() * other
@@ -66,8 +76,8 @@ class LpVariable:
     def __truediv__(self, other):
         return self._affine() / other
 
-    def __hash__(self) -> int:
-        return id(self)
+    # Variables are hashed by identity
+    __hash__ = object.__hash__
 
     def __eq__(self, other):
         if isinstance(other, LpVariable):
@@ -90,14 +100,16 @@ def toAffine(x) -> LpAffineExpression:
     if isinstance(x, LpAffineExpression):
         return x
     if isinstance(x, LpVariable):
-        return LpAffineExpression({x: 1.0}, 0.0)
+        return LpAffineExpression._new({x: 1.0}, 0.0)
     if isinstance(x, (float, int)):
-        return LpAffineExpression({}, x)
+        return LpAffineExpression._new({}, x)
     raise TypeError(x)
 
 
 class LpAffineExpression:
 
+    __slots__ = ('AX', 'b')
+
     def __init__(self, AX, b):
         assert isinstance(AX, dict)
         for x, a in AX.items():
@@ -107,21 +119,36 @@ class LpAffineExpression:
         self.AX = AX
         self.b = b
 
+    @classmethod
+    def _new(cls, AX, b):
+        # Expressions derived from other expressions need no validation
+        self = object.__new__(cls)
+        self.AX = AX
+        self.b = b
+        return self
+
     def __str__(self):
         return ' '.join([f'{a:+g}*{x.name}' for x, a in self.AX.items()] + [f'{self.b:+g}'])
 
     def _unary(self, op):
         AX = {x: op(a) for x, a in self.AX.items()}
         b = op(self.b)
-        return LpAffineExpression(AX, b)
+        return LpAffineExpression._new(AX, b)
 
     def _binary(self, other, op):
-        other = toAffine(other)
         AX = self.AX.copy()
-        for x, a in other.AX.items():
-            AX[x] = op(AX.get(x, 0.0), a)
-        b = op(self.b, other.b)
-        return LpAffineExpression(AX, b)
+        if isinstance(other, LpVariable):
+            AX[other] = op(AX.get(other, 0.0), 1.0)
+            b = self.b
+        elif isinstance(other, (float, int)):
+            b = op(self.b, other)
+        else:
+            other = toAffine(other)
+            get = AX.get
+            for x, a in other.AX.items():
+                AX[x] = op(get(x, 0.0), a)
+            b = op(self.b, other.b)
+        return LpAffineExpression._new(AX, b)
 
     def __iadd__(self, other):
         warnings.warn('in-place addition is not compatible with PuLP', stacklevel=2)
@@ -144,7 +171,7 @@ class LpAffineExpression:
         return other + -self
 
     def __neg__(self):
-        return toAffine(0.0) - self
+        return self._unary(operator.neg)
 
     def __mul__(self, other):
         assert isinstance(other, (float, int))
@@ -182,6 +209,28 @@ class LpAffineExpression:
         return res
 
 
+def lpSum(vector) -> LpAffineExpression:
+    '''Sum variables, expressions and numbers into a single expression.
+
+    Unlike chaining additions, which copies the partial sum on every step,
+    this takes time linear on the total number of terms.'''
+    AX:dict[LpVariable, float|int] = {}
+    b:float|int = 0.0
+    get = AX.get
+    for e in vector:
+        if isinstance(e, LpVariable):
+            AX[e] = get(e, 0.0) + 1.0
+        elif isinstance(e, LpAffineExpression):
+            for x, a in e.AX.items():
+                AX[x] = get(x, 0.0) + a
+            b += e.b
+        elif isinstance(e, (float, int)):
+            b += e
+        else:
+            raise TypeError(e)
+    return LpAffineExpression._new(AX, b)
+
+
 LpConstraintLE, LpConstraintGE, LpConstraintEQ = range(3)
 
 
@@ -214,6 +263,39 @@ _status_map = [
 ]
 
 
+_variable_index = operator.attrgetter('_index')
+
+
+class _Triplets:
+    '''Sparse matrix in coordinate format, built one row at a time.'''
+
+    def __init__(self):
+        self.rows = array('l')
+        self.cols = array('l')
+        self.data = array('d')
+        self.rhs = array('d')
+
+    def append(self, lhs, sign):
+        AX = lhs.AX
+        self.rows.extend(itertools.repeat(len(self.rhs), len(AX)))
+        self.cols.extend(map(_variable_index, AX))
+        if sign > 0:
+            self.data.extend(AX.values())
+            self.rhs.append(-lhs.b)
+        else:
+            self.data.extend(map(operator.neg, AX.values()))
+            self.rhs.append(lhs.b)
+
+    def matrix(self, indices):
+        '''Return the matrix and right-hand side, for the given sorted variable indices.'''
+        rows = np.frombuffer(self.rows, dtype=self.rows.typecode)
+        cols = np.searchsorted(indices, np.frombuffer(self.cols, dtype=self.cols.typecode))
+        data = np.frombuffer(self.data, dtype=np.float64)
+        A = coo_array((data, (rows, cols)), shape=(len(self.rhs), len(indices)))
+        b = np.frombuffer(self.rhs, dtype=np.float64)
+        return A.tocsr(), b
+
+
 class LpProblem:
 
     def __init__(self, name=None, sense=LpMinimize):
@@ -221,17 +303,30 @@ class LpProblem:
         self.objective = None
         assert sense == LpMinimize
         self.vd = {}
+        self._variables = {}
+        self._ub = _Triplets()
+        self._eq = _Triplets()
 
     def addConstraint(self, constraint):
         assert isinstance(constraint, LpConstraint)
         self.constraints.append(constraint)
+        lhs = constraint.lhs
+        self._variables.update(dict.fromkeys(lhs.AX))
+        if constraint.sense == LpConstraintEQ:
+            self._eq.append(lhs, 1)
+        elif constraint.sense == LpConstraintLE:
+            self._ub.append(lhs, 1)
+        else:
+            assert constraint.sense == LpConstraintGE
+            self._ub.append(lhs, -1)
 
     def setObjective(self, objective):
         if isinstance(objective, LpVariable):
             objective = toAffine(objective)
         else:
             assert isinstance(objective, LpAffineExpression)
-        assert self.objective is None
+        # Like PuLP, a new objective replaces the previous one, allowing to
+        # re-solve the same constraints with different costs.
         self.objective = objective
 
     def __iadd__(self, other):
@@ -275,80 +370,35 @@ class LpProblem:
 
         # https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.linprog.html
 
-        variables: dict[LpVariable, int] = {}
-        n_ub = 0
-        n_eq = 0
-
-        dtype = np.float64
-
-        A_ub_indptr = [0]
-        A_ub_indices = []
-        A_ub_data = []
-
-        A_eq_indptr = [0]
-        A_eq_indices = []
-        A_eq_data = []
-
-        b_ub_data = []
-        b_eq_data = []
+        assert self.objective is not None
 
-        for constraint in self.constraints:
-            if msg:
+        if msg:
+            for constraint in self.constraints:
                 sys.stderr.write(f'{constraint}\n')
-            lhs = constraint.lhs
-            if constraint.sense == LpConstraintEQ:
-                n_eq += 1
-            else:
-                n_ub += 1
-                if constraint.sense == LpConstraintGE:
-                    lhs = -lhs
-
-            rhs = -lhs.b
-
-            indices = []
-            data = []
-            for x, a in lhs.AX.items():
-                index = variables.setdefault(x, len(variables))
-                indices.append(index)
-                data.append(a)
-
-            if constraint.sense == LpConstraintEQ:
-                A_eq_indices.extend(indices)
-                A_eq_data.extend(data)
-                A_eq_indptr.append(len(A_eq_indices))
-                b_eq_data.append(rhs)
-            else:
-                A_ub_indices.extend(indices)
-                A_ub_data.extend(data)
-                A_ub_indptr.append(len(A_ub_indices))
-                b_ub_data.append(rhs)
-
-        assert self.objective is not None
-        for x, a in self.objective.AX.items():
-            variables.setdefault(x, len(variables))
 
-        n = len(variables)
+        # Map the variables' global indices into columns
+        variables = self._variables.copy()
+        variables.update(dict.fromkeys(self.objective.AX))
+        variables_list = sorted(variables, key=_variable_index)
+        n = len(variables_list)
+        indices = np.fromiter(map(_variable_index, variables_list), dtype=np.int_, count=n)
 
-        A_ub = csr_array((A_ub_data, A_ub_indices, A_ub_indptr), shape=(n_ub, n), dtype=dtype)
-        A_eq = csr_array((A_eq_data, A_eq_indices, A_eq_indptr), shape=(n_eq, n), dtype=dtype)
-        b_ub = np.array(b_ub_data, dtype=dtype)
-        b_eq = np.array(b_eq_data, dtype=dtype)
+        A_ub, b_ub = self._ub.matrix(indices)
+        A_eq, b_eq = self._eq.matrix(indices)
 
-        bounds:list[tuple[float|int|None, float|int|None]] = [(None, None)] * n
-        for x, i in variables.items():
-            if msg:
+        bounds:list[tuple[float|int|None, float|int|None]] = [(x._lbound, x._ubound) for x in variables_list]
+        if msg:
+            for x in variables_list:
                 sys.stderr.write(f'{x._lbound} <= {x.name} <= {x._ubound}\n')
-            bounds[i] = (x._lbound, x._ubound)
 
         if msg:
             sys.stderr.write(f'argmin({self.objective})\n')
-        c = np.zeros(shape=(n,), dtype=dtype)
-        for x, a in self.objective.AX.items():
-            i = variables[x]
-            c[i] = a
+        c = np.zeros(shape=(n,), dtype=np.float64)
+        objective_indices = np.fromiter(map(_variable_index, self.objective.AX), dtype=np.int_, count=len(self.objective.AX))
+        c[np.searchsorted(indices, objective_indices)] = np.fromiter(self.objective.AX.values(), dtype=np.float64, count=len(self.objective.AX))
 
         if msg:
-            sys.stderr.write(' '.join([str(v) for v in variables]) + '\n')
+            sys.stderr.write(' '.join([str(v) for v in variables_list]) + '\n')
             sys.stderr.write(f'A_ub: {A_ub.toarray()}\n')
             sys.stderr.write(f'b_ub: {b_ub}\n')
             sys.stderr.write(f'A_eq: {A_eq.toarray()}\n')
@@ -364,10 +414,9 @@ class LpProblem:
             sys.stderr.write(f'{et - st:.3f} seconds\n')
 
         if res.status == 0:
-            for x, i in variables.items():
-                x._value = res.x[i]
-                assert x.name not in self.vd
-                self.vd[x.name] = x
+            for x, value in zip(variables_list, res.x.tolist()):
+                x._value = value
+                assert self.vd.setdefault(x.name, x) is x
         else:
             sys.stderr.write(res.message + '\n')
 
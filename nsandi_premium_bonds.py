@@ -12,14 +12,19 @@
 
 from __future__ import annotations
 
+import dataclasses
+import itertools
 import logging
-import multiprocessing.dummy
 import operator
 import sys
+import typing
 
 from math import exp, factorial, lgamma, log
 
 import numpy as np
+import scipy.stats  # type: ignore[import-untyped]
+
+from environ import spawn_executor
 
 
 logger = logging.getLogger('nsandi')
@@ -35,14 +40,29 @@ def binomial(k:int, n:int, p:float) -> float:
         return float(factorial(n)) / float(factorial(k) * factorial(n - k)) * p**k * (1 - p)**(n - k)
 
 
+# Convolution truncated to the length of the inputs
 def combine(dist0:np.ndarray, dist1:np.ndarray) -> np.ndarray:
-    # This is a form of convolution, but it's not easy to coerce numpy.convolve
-    # to do exactly what we want.
     N, = dist0.shape
-    dist2 = np.zeros(N)
-    for i in range(N):
-        dist2[i:] += dist0[i]*dist1[:N - i]
-    return dist2
+    return np.convolve(dist0, dist1)[:N]
+
+
+@dataclasses.dataclass
+class MedianCurve:
+    # Holdings
+    n: np.ndarray
+
+    # Probabilities of the quantiles
+    quantiles: np.ndarray
+
+    # Yearly winnings for each holding and quantile, or NaN if beyond the
+    # truncated distribution
+    values: np.ndarray
+
+    # Median yearly winnings for each holding
+    median: np.ndarray
+
+    # Probability of winning nothing in a year for each holding
+    p_zero: np.ndarray
 
 
 class Calculator:
@@ -162,8 +182,8 @@ class Calculator:
 
             # The PMF of all prizes of equal value is given by the Bernoulli distribuion
             pmf1 = np.zeros(N)
-            for k in range(0, min(N // value, 12*volume) + 1):
-                pmf1[k * value // 25] = binomial(k, 12*volume, p)
+            k = np.arange(0, min((N - 1) * 25 // value, 12*volume) + 1)
+            pmf1[k * value // 25] = scipy.stats.binom.pmf(k, 12*volume, p)
 
             # Ensure the truncated PMF captures the bulk of the probability mass
             assert pmf1.sum() >= .99
@@ -178,36 +198,124 @@ class Calculator:
         median *= 25
         return median
 
+    def median_curve(self, ns:typing.Iterable[int]|None=None, quantiles:typing.Sequence[float]=(.10, .25, .50, .75, .90)) -> MedianCurve:
+        """Yearly winnings quantiles for many holdings at once, by default for
+        every £25 up to £50k."""
+
+        if ns is None:
+            ns = range(25, 50000 + 25, 25)
+        n = np.asarray(list(ns), dtype=np.int64)
+        assert np.all(n > 0)
+        assert np.all(n <= 50000)
+        assert np.all(n % 25 == 0)
+        assert np.all(n // 25 < self.total_bonds)
+        p = (n // 25) / self.total_bonds
+
+        N = 50000 // 25
+
+        # With such small odds the number of prizes of each value is very
+        # closely approximated by a Poisson distribution, so the winnings
+        # follow a compound Poisson distribution, with a rate proportional to
+        # the holding, but the same prize distribution for all holdings.
+        # So the PMF of the sum of k prizes is computed only once, and the
+        # winnings PMF for each holding is the sum of these weighted by the
+        # probability of k prizes.
+        volume = 12*self.total_volume
+        rate = volume * p
+        prize_pmf = np.zeros(N)
+        for value, prize_volume in self.prizes:
+            assert value % 25 == 0
+            if value // 25 < N:
+                prize_pmf[value // 25] += 12*prize_volume / volume
+
+        # Ignore the right tail of the number of prizes
+        K = int(scipy.stats.poisson.isf(1e-12, rate.max())) + 1
+        K = min(K, N)
+        qk = np.zeros((K, N))
+        qk[0, 0] = 1.0
+        for k in range(1, K):
+            qk[k] = combine(qk[k - 1], prize_pmf)
+
+        pk = scipy.stats.poisson.pmf(np.arange(K)[np.newaxis, :], rate[:, np.newaxis])
+        pmf = pk @ qk
+
+        # Obtain the quantiles through the Cumulative Mass Function (CMF)
+        cmf = np.cumsum(pmf, axis=1)
+        q = np.asarray(quantiles, dtype=np.float64)
+        indices = (cmf[:, np.newaxis, :] <= q[np.newaxis, :, np.newaxis]).sum(axis=2)
+        values = np.where(indices < N, indices * 25.0, np.nan)
+
+        indices = (cmf <= 0.5).sum(axis=1)
+        assert np.all(indices < N)
+        median = indices * 25
+
+        p_zero = np.exp(volume * np.log1p(-p))
+
+        return MedianCurve(n=n, quantiles=q, values=values, median=median, p_zero=p_zero)
+
     # Divide samples in this number of chunks for efficiency.
     chunk = 1024
 
-    def sample(self, p:float) -> np.ndarray:
-        prize = np.zeros([self.chunk], dtype=np.int64)
+    # Samples per task.  Fixed, so that results only depend on the seed, and
+    # not on the number of workers.
+    task_size = 1024*1024
+
+    def sample(self, p:float, rng:np.random.Generator, size:int|None=None) -> np.ndarray:
+        if size is None:
+            size = self.chunk
+        prize = np.zeros([size], dtype=np.int64)
         for value, volume in self.prizes:
-            k = np.random.binomial(12*volume, p, size=[self.chunk])
+            k = rng.binomial(12*volume, p, size=[size])
             prize += k*value
         return prize
 
-    # Obtain the median through Monte Carlo simulation using multiple threads.
+    def histogram(self, p:float, seed:np.random.SeedSequence, size:int) -> np.ndarray:
+        """Histogram of yearly winnings in £25 bins, the last bin
+        accumulating all winnings of £50k or more."""
+        rng = np.random.default_rng(seed)
+        bins = 50000 // 25 + 1
+        hist = np.zeros([bins], dtype=np.int64)
+        for start in range(0, size, self.chunk):
+            prize = self.sample(p, rng, min(self.chunk, size - start))
+            hist += np.bincount(np.minimum(prize // 25, bins - 1), minlength=bins)
+        return hist
+
+    # Obtain the median through Monte Carlo simulation using multiple processes.
     # Essentially used to verify the correctness of the median() function above.
-    def median_mc(self, n:int, N:int) -> int:
+    def median_mc(self, n:int, N:int, seed:int|None=None, max_workers:int|None=None) -> float:
         assert n > 0
         assert n <= 50000
         assert n % 25 == 0
+        assert N > 0
 
         our_bonds = n // 25
 
         assert our_bonds < self.total_bonds
         p = our_bonds / self.total_bonds
 
-        pool = multiprocessing.dummy.Pool((multiprocessing.cpu_count() + 1) // 2)
-
-        nchunks = (N + 1) // self.chunk
-
-        samples = pool.map(self.sample, [p]*nchunks )
-
-        median = np.median(samples)
-        return median
+        sizes = [self.task_size] * (N // self.task_size)
+        if N % self.task_size:
+            sizes.append(N % self.task_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        # Each task reduces its samples into a histogram, so memory usage
+        # doesn't grow with the number of samples
+        hist = np.zeros([50000 // 25 + 1], dtype=np.int64)
+        if len(sizes) == 1 or max_workers == 1:
+            for h in map(self.histogram, itertools.repeat(p), seeds, sizes):
+                hist += h
+        else:
+            with spawn_executor(max_workers) as executor:
+                for h in executor.map(self.histogram, itertools.repeat(p), seeds, sizes):
+                    hist += h
+
+        # Same as numpy.median, averaging the middle samples when there's an
+        # even number of them
+        cmf = np.cumsum(hist)
+        lo = int(np.searchsorted(cmf, (N - 1) // 2, side='right'))
+        hi = int(np.searchsorted(cmf, N // 2, side='right'))
+        assert hi < len(hist) - 1
+        return (lo + hi) * 25 / 2
 
 
 def main() -> None:
@@ -220,8 +328,8 @@ def main() -> None:
         print(f'{n}:')
         m = c.median(n)
         print(f'  Median (accurate):  {m:4.0f} {m/n:.2%}')
-        m = c.median_mc(n, 512*1024)
-        print(f'  Median (MC):        {m:4.0f} {m/n:.2%}')
+        m_mc = c.median_mc(n, 512*1024, seed=0)
+        print(f'  Median (MC):        {m_mc:4.0f} {m_mc/n:.2%}')
 
 
 if __name__ == '__main__':
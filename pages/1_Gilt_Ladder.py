@@ -147,12 +147,22 @@ else:
 rpi_series = common.get_latest_rpi()
 issued = common.get_issued_gilts(rpi_series)
 prices = common.get_latest_gilt_close_prices()
-bl = BondLadder(issued, prices, s)
+# Keep the ladder across reruns, so its model is reused when only prices change
+try:
+    bl = st.session_state.bond_ladder
+except AttributeError:
+    bl = BondLadder(issued, prices, s)
+    st.session_state.bond_ladder = bl
+else:
+    bl.issued = issued
+    bl.rpi_series = rpi_series
+    bl.prices = prices
+    bl.schedule = s
+    bl.today = today
 bl.index_linked = index_linked
 bl.marginal_income_tax = st.session_state.marginal_income_tax
 bl.interest_rate = st.session_state.interest_rate * .01
-if experimental:
-    bl.lag = st.session_state.window * 12
+bl.lag = st.session_state.window * 12 if experimental else 0
 with st.spinner('Solving...'):
     bl.solve()
 
@@ -14,9 +14,11 @@ import streamlit as st
 import pandas as pd
 
 from tax.uk import aa, uiaa
-from rtp.model import model, column_headers, dataframe
+from rtp.model import column_headers, dataframe
+from rtp.cache import ResultCache
 
 import common
+import environ
 
 
 common.set_page_config(
@@ -324,9 +326,12 @@ if params['db_payments_1'] or params['db_payments_2']:
 
 
 # https://docs.streamlit.io/library/advanced-features/caching
-#@st.cache_data(ttl=3600, max_entries=1024)
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(maxsize=1024, directory=environ.rtp_cache_dir)
+
 def run(params):
-    return model(**params)
+    return get_result_cache().run(params)
 
 try:
     result = run(params)
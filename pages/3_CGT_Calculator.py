@@ -12,11 +12,11 @@ import warnings
 
 import streamlit as st
 
+import cgtcalc
 import common
 
-from typing import TextIO
 from tax.uk import TaxYear
-from cgtcalc import Calculator
+from cgtcalc import Calculator, Trade
 from report import Report, HtmlReport, TextReport, PdfReport
 
 
@@ -72,16 +72,19 @@ transactions = st.text_area(
 # Calculation
 #
 
-stream:TextIO
-if transactions:
-    stream = io.StringIO(transactions)
-else:
-    stream = open(placeholder_filename, 'rt')
+# Parsing doesn't depend on parameters, so skip it on re-runs
+@st.cache_data(max_entries=16, show_spinner=False)
+def parse_trades(transactions:str) -> list[tuple[str, Trade]]:
+    return list(cgtcalc.parse_trades(io.StringIO(transactions)))
+
+
+if not transactions:
+    transactions = open(placeholder_filename, 'rt').read()
 
 calculator = Calculator(rounding=rounding)
 with warnings.catch_warnings(record=True) as caught_warnings:
     warnings.simplefilter("always")
-    calculator.parse(stream)
+    calculator.add_trades(parse_trades(transactions))
     result = calculator.calculate()
     for warning in caught_warnings:
         st.warning(warning.message, icon="⚠️")
@@ -5,6 +5,9 @@
 #
 
 
+import typing
+
+import pandas as pd
 import streamlit as st
 
 import common
@@ -71,6 +74,20 @@ with col2:
     st.metric('Annuity rate', f'£{annuity_rate:,.0f} / £100k')
 
 
+st.subheader('Annuity rates by age')
+
+rate_ages = list(range(55, 86, 5))
+rates:dict[str, typing.Any] = {'Age': rate_ages}
+for name, (kind, escalation_func) in escalations.items():
+    unit_present_values = annuities.present_values(rate_ages, get_yield_curve(kind), table, escalation=escalation_func)
+    rates[name] = 100000.0 / unit_present_values
+st.dataframe(
+    pd.DataFrame(rates),
+    hide_index=True,
+    column_config={name: st.column_config.NumberColumn(format="£%.0f") for name in escalations},
+)
+
+
 st.header('Resources')
 
 st.markdown('''
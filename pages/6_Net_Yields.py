@@ -22,8 +22,8 @@ import nsandi_premium_bonds
 import ukcalendar
 
 from data.boe import Curve, YieldCurve
-from gilts.gilts import IndexLinkedGilt
-from xirr import xirr
+from gilts.gilts import IndexLinkedGilt, GiltBook
+from xirr import xirr_many, pad_series
 
 from tax.uk import cgt_rates
 
@@ -169,16 +169,18 @@ if index_linked is None and implied_inflation:
     # TODO: Move this as a factory method of the RPI class
     n0 = len(rpi_series.series) -1
     date0 = datetime.date(year=rpi_series.ref_year + n0 // 12, month=0 % 12 + 1, day=1)
-    rpi0 = rpi_series.series[-1]
+    rpi0 = rpi_series.latest()
+    extension:list[float] = []
     while True:
-        n1 = len(rpi_series.series)
+        n1 = n0 + 1 + len(extension)
         date1 = datetime.date(year=rpi_series.ref_year + n1 // 12, month=n1 % 12 + 1, day=1)
         years_exact = (n1 - n0) / 12
         years_round = ((n1 - n0) + 5) // 6 * 0.5
         if years_round > 40.0:
             break
         rpi1 = rpi0 * (1 + inflation_curve(years_round)) ** years_exact
-        rpi_series.series.append(rpi1)
+        extension.append(rpi1)
+    rpi_series.extend(extension)
 
 
 issued = common.get_issued_gilts(rpi_series)
@@ -191,19 +193,16 @@ else:
 
 
 maturity_limit = ukcalendar.shift_year(today, maturity)
-for g in issued.filter(index_linked=index_linked, settlement_date=settlement_date):
-    if g.maturity > maturity_limit:
-        continue
+book = GiltBook([g for g in issued.filter(index_linked=index_linked, settlement_date=settlement_date) if g.maturity <= maturity_limit], settlement_date)
+tidms = [prices.lookup_tidm(g.isin) for g in book.gilts]
+dirty_prices = book.dirty_prices([prices.get_price(tidm) for tidm in tidms])
+gross_yields = book.ytm(dirty_prices)
+if index_linked:
+    gross_yields = (1.0 + gross_yields)/(1.0 + IndexLinkedGilt.inflation_rate) - 1.0
 
-    isin = g.isin
-    tidm = prices.lookup_tidm(isin)
-    clean_price = prices.get_price(tidm)
-    accrued_interest = g.accrued_interest(settlement_date)
-    dirty_price = g.dirty_price(clean_price, settlement_date)
-
-    gross_yield = g.ytm(dirty_price, settlement_date)
-    if index_linked:
-        gross_yield = (1.0 + gross_yield)/(1.0 + IndexLinkedGilt.inflation_rate) - 1.0
+series_values = []
+series_dates = []
+for g, accrued_interest, dirty_price in zip(book.gilts, book.accrued_interest.tolist(), dirty_prices.tolist()):
 
     transactions = []
     purchase_price = qt*dirty_price + tc
@@ -230,8 +229,13 @@ for g in issued.filter(index_linked=index_linked, settlement_date=settlement_dat
     transactions.append((d, redemption_value))
 
     dates, values = zip(*transactions)
-    net_yield = xirr(values, dates)
+    series_dates.append(dates)
+    series_values.append(values)
+
+# Solve all net yields at once
+net_yields = xirr_many(*pad_series(series_values, series_dates))
 
+for g, tidm, gross_yield, net_yield in zip(book.gilts, tidms, gross_yields.tolist(), net_yields.tolist()):
     maturity_ = (g.maturity - issued.close_date).days / 365.25
 
     url = f'https://www.londonstockexchange.com/stock/{tidm}/united-kingdom'
@@ -300,6 +304,26 @@ common.plot_yield_curve(df, yTitle='Gross Yield (%)', ySeries='GrossYield', cSer
 common.plot_yield_curve(df, yTitle='Net Yield (%)', ySeries='NetYield', cSeries='Instrument', ois=ois_net_curve)
 
 
+@st.cache_data(ttl=24*60*60, show_spinner='Calculating NS&I Premium Bonds winnings.')
+def premium_bonds_curve() -> pd.DataFrame:
+    calculator = nsandi_premium_bonds.Calculator.from_latest()
+    curve = calculator.median_curve(quantiles=(.25, .75))
+    return pd.DataFrame({
+        'Holding': curve.n,
+        'Lower quartile': curve.values[:, 0] / curve.n * 100,
+        'Median': curve.median / curve.n * 100,
+        'Upper quartile': curve.values[:, 1] / curve.n * 100,
+        'No prizes': curve.p_zero * 100,
+    })
+
+
+st.subheader('Premium Bonds')
+
+premium_bonds_df = premium_bonds_curve()
+st.line_chart(premium_bonds_df, x='Holding', y=['Lower quartile', 'Median', 'Upper quartile'], x_label='Holding (£)', y_label='Yearly yield (%)')
+st.line_chart(premium_bonds_df, x='Holding', y='No prizes', x_label='Holding (£)', y_label='Chance of no prizes in a year (%)')
+
+
 #
 # Links
 #
@@ -13,7 +13,7 @@ import sys
 import textwrap
 
 
-from typing import Sequence, Any, BinaryIO, TextIO
+from typing import Callable, Iterable, Sequence, Any, BinaryIO, TextIO
 from abc import ABC, abstractmethod
 
 
@@ -31,7 +31,7 @@ class Report(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def write_table(self, rows:list[list], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
+    def write_table(self, rows:Iterable[Sequence[Any]], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
         raise NotImplementedError
 
     @staticmethod
@@ -45,6 +45,45 @@ class Report(ABC):
         pass
 
 
+def _format_table(rows:Iterable[Sequence[Any]], header:Sequence[Any]|None, footer:Sequence[Any]|None, just:Sequence[Any]|None) -> tuple[list[str]|None, list[list[str]], list[str]|None, list[int], list[Callable[[str, int], str]]]:
+    """Format the cells of a fixed width table, and measure its columns."""
+
+    fmt = Report.format
+    header_ = None if header is None else [fmt(field) for field in header]
+    footer_ = None if footer is None else [fmt(field) for field in footer]
+    # Column widths depend on every row, so formatted rows must be kept
+    body = [[fmt(field) for field in row] for row in rows]
+
+    lines = body
+    if header_ is not None:
+        lines = [header_] + lines
+    if footer_ is not None:
+        lines = lines + [footer_]
+    widths = [0] * (len(lines[0]) if lines else len(just or ''))
+    for line in lines:
+        assert len(line) == len(widths)
+        for c, cell in enumerate(line):
+            widths[c] = max(widths[c], len(cell))
+
+    justs:list[Callable[[str, int], str]]
+    if just is None:
+        justs = [str.center]*len(widths)
+    else:
+        assert len(just) == len(widths)
+        m = {
+            'c': str.center,
+            'l': str.ljust,
+            'r': str.rjust,
+        }
+        justs = [m[j] for j in just]
+
+    return header_, body, footer_, widths, justs
+
+
+def _justify_row(row:list[str], widths:list[int], justs:list[Callable[[str, int], str]], sep:str='  ') -> str:
+    return sep.join([j(cell, width) for cell, width, j in zip(row, widths, justs)]).rstrip()
+
+
 class TextReport(Report):
 
     def __init__(self, stream:TextIO=sys.stdout):
@@ -70,49 +109,10 @@ class TextReport(Report):
         self.stream.write(paragraph + '\n\n')
         self.heading_sep = '\n'
 
-    def write_table(self, rows:list[list], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
+    def write_table(self, rows:Iterable[Sequence[Any]], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
         stream = self.stream
 
-        columns = [list(col) for col in zip(*rows)]
-        if header is not None:
-            header = list(header)
-            assert len(header) == len(columns)
-        if footer is not None:
-            footer = list(footer)
-            assert len(footer) == len(columns)
-        if just is None:
-            just = [str.center]*len(columns)
-        else:
-            assert len(just) == len(columns)
-            m = {
-                'c': str.center,
-                'l': str.ljust,
-                'r': str.rjust,
-            }
-            just = [m[j] for j in just]
-
-        widths = []
-        for c in range(len(columns)):
-            width = 0
-            if header is not None:
-                header[c] = self.format(header[c])
-                width = max(width, len(header[c]))
-            if footer is not None:
-                footer[c] = self.format(footer[c])
-                width = max(width, len(footer[c]))
-            column = columns[c]
-            for r in range(len(column)):
-                cell = column[r]
-                cell = self.format(cell)
-                column[r] = cell
-                width = max(width, len(cell))
-            if header is not None:
-                header[c] = just[c](header[c], width)
-            for r in range(len(column)):
-                column[r] = just[c](column[r], width)
-            if footer is not None:
-                footer[c] = just[c](footer[c], width)
-            widths.append(width)
+        header, body, footer, widths, justs = _format_table(rows, header, footer, just)
 
         sep = '  '
 
@@ -120,15 +120,16 @@ class TextReport(Report):
         rule = '─' * line_width
 
         if header is not None:
-            stream.write(indent + sep.join(header).rstrip() + '\n')
+            stream.write(indent + _justify_row(header, widths, justs, sep) + '\n')
             stream.write(indent + rule + '\n')
-        for row in zip(*columns):
-            stream.write(indent + sep.join(row).rstrip() + '\n')
+        for row in body:
+            stream.write(indent + _justify_row(row, widths, justs, sep) + '\n')
         if footer is not None:
             stream.write(indent + rule + '\n')
-            stream.write(indent + sep.join(footer).rstrip() + '\n')
+            stream.write(indent + _justify_row(footer, widths, justs, sep) + '\n')
 
         stream.write('\n')
+        stream.flush()
 
         self.heading_sep = '\n'
 
@@ -245,7 +246,7 @@ th, td {
         field = html.escape(field)
         return field
 
-    def write_table(self, rows:list[list], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
+    def write_table(self, rows:Iterable[Sequence[Any]], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
         fmt = self.format_and_escape
 
         if just is None:
@@ -274,6 +275,7 @@ th, td {
 
         self.stream.write('</table>\n')
         self.stream.write('</div>\n')
+        self.stream.flush()
 
     def end(self) -> None:
         self.stream.write('\n')
@@ -329,61 +331,22 @@ class PdfReport(Report):
         self._ln()
         self.heading_sep = True
 
-    def write_table(self, rows:list[list], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
-
-        columns = [list(col) for col in zip(*rows)]
-        if header is not None:
-            header = list(header)
-            assert len(header) == len(columns)
-        if footer is not None:
-            footer = list(footer)
-            assert len(footer) == len(columns)
-        if just is None:
-            just = [str.center]*len(columns)
-        else:
-            assert len(just) == len(columns)
-            m = {
-                'c': str.center,
-                'l': str.ljust,
-                'r': str.rjust,
-            }
-            just = [m[j] for j in just]
+    def write_table(self, rows:Iterable[Sequence[Any]], header:Sequence[Any]|None=None, footer:Sequence[Any]|None=None, just:Sequence[Any]|None=None, indent:str='') -> None:  # pragma: no cover
 
-        widths = []
-        for c in range(len(columns)):
-            width = 0
-            if header is not None:
-                header[c] = self.format(header[c])
-                width = max(width, len(header[c]))
-            if footer is not None:
-                footer[c] = self.format(footer[c])
-                width = max(width, len(footer[c]))
-            column = columns[c]
-            for r in range(len(column)):
-                cell = column[r]
-                cell = self.format(cell)
-                column[r] = cell
-                width = max(width, len(cell))
-            if header is not None:
-                header[c] = just[c](header[c], width)
-            for r in range(len(column)):
-                column[r] = just[c](column[r], width)
-            if footer is not None:
-                footer[c] = just[c](footer[c], width)
-            widths.append(width)
+        header, body, footer, widths, justs = _format_table(rows, header, footer, just)
 
         sep = '  '
 
         line_width = len(sep.join([' '*width for width in widths]))
 
         if header is not None:
-            self.write_line(indent + sep.join(header).rstrip())
+            self.write_line(indent + _justify_row(header, widths, justs, sep))
             self._rule(line_width, indent)
-        for row in zip(*columns):
-            self.write_line(indent + sep.join(row).rstrip())
+        for row in body:
+            self.write_line(indent + _justify_row(row, widths, justs, sep))
         if footer is not None:
             self._rule(line_width, indent)
-            self.write_line(indent + sep.join(footer).rstrip())
+            self.write_line(indent + _justify_row(footer, widths, justs, sep))
 
         self._ln()
 
@@ -0,0 +1,175 @@
+#
+# Copyright (c) 2025 LateGenXer
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+
+"""Memoization of retirement model results."""
+
+
+import collections
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+
+import tax.jp
+import tax.pt
+import tax.uk
+
+from rtp import model
+
+
+logger = logging.getLogger('rtp.cache')
+
+
+@functools.cache
+def version() -> str:
+    """Digest of the sources that determine a model's result, so that any
+    change to the tax constants or the model itself invalidates cached
+    results."""
+    h = hashlib.sha256()
+    for module in (tax.uk, tax.pt, tax.jp, model):
+        assert module.__file__ is not None
+        with open(module.__file__, 'rb') as stream:
+            h.update(stream.read())
+    return h.hexdigest()
+
+
+def normalize(value):
+    """Normalize parameters, so that equivalent values hash the same."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    raise TypeError(value)
+
+
+def key(params:dict) -> str:
+    # Foreign exchange rates used by the model are updated monthly
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    document = {
+        'params': normalize(params),
+        'version': version(),
+        'month': f'{today:%Y-%m}',
+    }
+    data = json.dumps(document, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Least recently used cache of model results, keyed by parameters.
+
+    When a directory is given, results are also stored there, so that they
+    survive restarts and can be shared among processes."""
+
+    def __init__(self, maxsize:int=256, directory:str|None=None, max_files:int=4096):
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_files = max_files
+        self._entries:collections.OrderedDict[str, model.Result] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def run(self, params:dict) -> model.Result:
+        k = key(params)
+
+        result = self._get(k)
+        if result is None:
+            result = self._load(k)
+            if result is None:
+                result = model.model(**params)
+                self._store(k, result)
+            self._put(k, result)
+
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, k:str) -> model.Result|None:
+        with self._lock:
+            try:
+                result = self._entries[k]
+            except KeyError:
+                return None
+            self._entries.move_to_end(k)
+            return result
+
+    def _put(self, k:str, result:model.Result) -> None:
+        with self._lock:
+            self._entries[k] = result
+            self._entries.move_to_end(k)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _filename(self, k:str) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, f'{k}.pickle')
+
+    def _load(self, k:str) -> model.Result|None:
+        if self.directory is None:
+            return None
+        filename = self._filename(k)
+        try:
+            with open(filename, 'rb') as stream:
+                result = pickle.load(stream)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logger.warning(f'{filename}: {ex}')
+            return None
+        if not isinstance(result, model.Result):
+            return None
+        # Track usage through the modification time
+        try:
+            os.utime(filename)
+        except OSError:  # pragma: no cover
+            pass
+        return result
+
+    def _store(self, k:str, result:model.Result) -> None:
+        if self.directory is None:
+            return
+        filename = self._filename(k)
+        head, tail = os.path.split(filename)
+        tid = threading.get_native_id()
+        tmp_filename = os.path.join(head, f'.{tail}.{os.getpid()}.{tid}')
+        with open(tmp_filename, 'wb') as stream:
+            pickle.dump(result, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, filename)
+        self._prune()
+
+    def _prune(self) -> None:
+        assert self.directory is not None
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.pickle') and not entry.name.startswith('.'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:  # pragma: no cover
+                        pass
+        if len(entries) <= self.max_files:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_files]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:  # pragma: no cover
+                pass
@@ -7,6 +7,7 @@
 
 
 import dataclasses
+import itertools
 import sys
 
 from typing import Any
@@ -14,6 +15,7 @@ from typing import Any
 import lp
 
 from data import hmrc
+from environ import spawn_executor
 
 import tax.uk as UK
 import tax.pt as PT
@@ -22,7 +24,17 @@ import tax.jp as JP
 
 verbosity = 0
 
-uid = 0
+
+def new_uid(prob) -> int:
+    """Return a number for naming variables, unique within the problem.
+
+    The counter is kept by the problem itself, so that several models can be
+    built at the same time, e.g., from different threads."""
+    try:
+        counter = prob.uid_counter
+    except AttributeError:
+        counter = prob.uid_counter = itertools.count()
+    return next(counter)
 
 
 @dataclasses.dataclass
@@ -101,7 +113,6 @@ class Result:
 
 
 def income_tax_lp(prob, gross_income, income_tax_bands, factor=1.0):
-    global uid
     total = 0
     tax = 0
     lbound = 0
@@ -111,8 +122,8 @@ def income_tax_lp(prob, gross_income, income_tax_bands, factor=1.0):
         else:
             ubound *= factor
             ub = ubound - lbound
+        uid = new_uid(prob)
         income_tax_band = lp.LpVariable(f'net_{uid}_{int(rate*1000)}', 0, ub)
-        uid += 1
         total = total + income_tax_band
         tax = tax + income_tax_band * rate
         lbound = ubound
@@ -121,10 +132,9 @@ def income_tax_lp(prob, gross_income, income_tax_bands, factor=1.0):
 
 
 def uk_cgt_lp(prob, cg, cgt_rate, cgt_allowance):
-    global uid
+    uid = new_uid(prob)
     cg_00 = lp.LpVariable(f'cgt_{uid}_00', 0, cgt_allowance)
     cg_xx = lp.LpVariable(f'cgt_{uid}_xx', 0)
-    uid += 1
     prob += cg_00 + cg_xx == cg
     tax = cg_xx * cgt_rate
     return tax
@@ -132,7 +142,7 @@ def uk_cgt_lp(prob, cg, cgt_rate, cgt_allowance):
 
 def uk_tax_lp(prob, gross_income, cg, itt:UK.IncomeTaxThresholds, marriage_allowance:int=0):
     assert not isinstance(marriage_allowance, bool)
-    global uid
+    uid = new_uid(prob)
 
     personal_allowance    = itt.income_tax_threshold_20 + marriage_allowance
     basic_rate_allowance  = itt.income_tax_threshold_40 - itt.income_tax_threshold_20
@@ -169,8 +179,6 @@ def uk_tax_lp(prob, gross_income, cg, itt:UK.IncomeTaxThresholds, marriage_allow
     cgt = cg_basic_rate  * cgt_rate_basic \
         + cg_higher_rate * cgt_rate_higher
 
-    uid += 1
-
     return income_tax, cgt
 
 
@@ -227,10 +235,9 @@ class DCP:
         return tfc
 
     def tfc_lp(self, age):
-        global uid
+        uid = new_uid(self.prob)
         crystalized_tfc = lp.LpVariable(f'crystalized_tfc_{uid}', 0)
         crystalized_inc = lp.LpVariable(f'crystalized_inc_{uid}', 0)
-        uid += 1
         self.prob += 3*crystalized_tfc <= crystalized_inc
         self.lsa = self.lsa - crystalized_tfc
         self.prob += self.lsa >= 0
@@ -253,10 +260,10 @@ class GIA:
         self.growth_rate_real = inflation_ajusted_return(self.growth_rate, self.inflation_rate)
 
     def flow(self, inflation_adjusted=False):
-        global uid
+        uid = new_uid(self.prob)
 
-        total = 0
-        gains = 0
+        total = []
+        gains = []
 
         purchase = lp.LpVariable(f'gia_purchase_{uid}', 0)
         self.assets.insert(0, purchase)
@@ -267,22 +274,17 @@ class GIA:
             proceeds = lp.LpVariable(f'gia_proceeds_{uid}_{yr}', 0)
             self.assets[yr] = self.assets[yr] - proceeds
             self.prob += self.assets[yr] >= 0
-            total = total + proceeds
-            gains = gains + proceeds * (1.0 - (1.0 + growth_rate) ** -yr)
+            total.append(proceeds)
+            gains.append(proceeds * (1.0 - (1.0 + growth_rate) ** -yr))
 
         for yr in range(0, len(self.assets)):
             self.assets[yr] *= (1.0 + self.growth_rate_real) * (1.0 - eps)
 
-        uid += 1
-
-        return total - purchase, gains
+        return lp.lpSum(total) - purchase, lp.lpSum(gains)
 
 
     def value(self):
-        total = 0
-        for balance in self.assets:
-            total = total + balance
-        return total
+        return lp.lpSum(self.assets)
 
 
 # Introduce a tiny bias towards SIPPs uncrystalized funds and against
@@ -768,6 +770,25 @@ def model(
 
     return result
 
+def _model(params):
+    return model(**params)
+
+
+def model_batch(params_list, max_workers=None):
+    """Solve several independent scenarios, e.g., for sensitivity analysis.
+
+    Each scenario is a dictionary with model()'s keyword arguments.  The
+    scenarios are solved in a pool of processes, and the results returned in
+    the same order."""
+
+    params_list = list(params_list)
+    if len(params_list) <= 1 or max_workers == 1:
+        return [_model(params) for params in params_list]
+
+    with spawn_executor(max_workers) as executor:
+        return list(executor.map(_model, params_list))
+
+
 # Columns headers for DataFrame
 column_headers = {
     'year': 'Year',
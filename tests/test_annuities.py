@@ -5,6 +5,7 @@
 #
 
 
+import numpy as np
 import pytest
 
 import annuities
@@ -30,3 +31,40 @@ def yield_curve(request):
 def test_annuity_rate(yield_curve, table):
     ar = annuities.annuity_rate(66, yield_curve, table)
     assert 0.0 < ar < 1.0
+
+
+def synthetic_table(min_age:int=20, max_age:int=120) -> mortality.Table:
+    ages = np.arange(min_age, max_age + 1)[:, np.newaxis]
+    years = np.arange(101)[np.newaxis, :]
+    array = np.minimum(1e-4 * np.exp(0.09 * ages) * (1.0 - 0.001 * years), 1.0)
+    array[-1] = 1.0
+    return mortality.Table(min_year=2026, max_year=2126, min_age=min_age, max_age=max_age, array=array)
+
+
+# Reference implementation
+def present_value(cur_age, yield_curve, table, escalation):
+    yob = annuities.cur_year - cur_age
+    p = 1.0
+    pv = 0.0
+    for age in range(cur_age, 121):
+        years = age - cur_age
+        index = min(max(float(years), 0.5), 40.0)
+        pv += escalation(years) * p * (1.0 + yield_curve(index))**-years
+        p *= 1.0 - table.mortality(yob + age, age)
+    assert p == 0.0
+    return pv
+
+
+@pytest.mark.parametrize('escalation', [
+    annuities.escalation_level,
+    annuities.escalation_fixed(.03),
+    annuities.escalation_deferred(5)(annuities.escalation_fixed(.02)),
+])
+def test_present_values(escalation):
+    table = synthetic_table()
+    yield_curve = boe.Curve(np.linspace(0.5, 40.0, 80), np.linspace(0.01, 0.045, 80))
+    cur_ages = list(range(20, 121))
+    pvs = annuities.present_values(cur_ages, yield_curve, table, escalation)
+    for cur_age, pv in zip(cur_ages, pvs):
+        assert pv == pytest.approx(present_value(cur_age, yield_curve, table, escalation), rel=1e-12)
+        assert annuities.present_value(cur_age, yield_curve, table, escalation) == pytest.approx(pv, rel=1e-12)
@@ -21,19 +21,35 @@ import warnings
 import pytest
 
 from contextlib import nullcontext
-from decimal import Decimal
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_EVEN
 from glob import glob
 from pprint import pp
 
 from environ import ci
 from tax.uk import TaxYear
-from cgtcalc import Calculator, DisposalResult, Result
+from cgtcalc import Calculator, DisposalResult, Result, dround, parse_trades, read_trades_cache, write_trades_cache, trades_cache_filename
 from report import TextReport, HtmlReport
 
 
 data_dir = os.path.join(os.path.dirname(__file__), 'data')
 
 
+@pytest.mark.parametrize("value,places,rounding,expected", [
+    ('1.005', 2, ROUND_HALF_EVEN, '1.00'),
+    ('1.015', 2, ROUND_HALF_EVEN, '1.02'),
+    ('1.001', 2, ROUND_CEILING, '1.01'),
+    ('-1.001', 2, ROUND_CEILING, '-1.00'),
+    ('1.999', 0, ROUND_FLOOR, '1'),
+    ('1.5', 2, ROUND_CEILING, '1.5'),
+    ('1.50', 0, None, '2'),
+    ('1E+2', 2, ROUND_CEILING, '100'),
+    ('NaN', 2, ROUND_CEILING, 'NaN'),
+    ('1.0123456789', 9, ROUND_HALF_EVEN, '1.012345679'),
+])
+def test_dround(value:str, places:int, rounding:str|None, expected:str) -> None:
+    assert str(dround(Decimal(value), places, rounding)) == expected
+
+
 def collect_filenames(no_raises:bool=False) -> list:
     filenames = []
     for filename in glob(os.path.join(data_dir, 'cgtcalc', '*.tsv')):
@@ -329,6 +345,193 @@ def test_filter_tax_year(filename:str) -> None:
     assert not filtered_result.tax_years
 
 
+def read_file(filename:str) -> tuple[os.stat_result, bytes]:
+    with open(filename, 'rb') as stream:
+        return os.fstat(stream.fileno()), stream.read()
+
+
+@pytest.mark.parametrize("filename", collect_filenames(no_raises=True))
+def test_trades_cache(filename:str, tmp_path) -> None:
+    tmp_filename = str(tmp_path / os.path.basename(filename))
+    with open(filename, 'rt') as src, open(tmp_filename, 'wt') as dst:
+        dst.write(src.read())
+
+    with open(tmp_filename, 'rt') as stream:
+        trades = list(parse_trades(stream))
+
+    st, contents = read_file(tmp_filename)
+    assert read_trades_cache(tmp_filename, st, contents) is None
+    write_trades_cache(tmp_filename, st, contents, trades)
+    cached_trades = read_trades_cache(tmp_filename, st, contents)
+    assert cached_trades is not None
+
+    # Parameters must be reproduced exactly, as their representation shows in reports
+    assert [(security, tr.date, tr.kind, [str(param) for param in tr.params]) for security, tr in cached_trades] == \
+           [(security, tr.date, tr.kind, [str(param) for param in tr.params]) for security, tr in trades]
+
+    # Touched but unchanged, which updates the cache, so that it's not hashed again
+    os.utime(tmp_filename, ns=(0, 0))
+    st, contents = read_file(tmp_filename)
+    assert read_trades_cache(tmp_filename, st, contents) is not None
+    assert read_trades_cache(tmp_filename, st, b'') is not None
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(os.path.basename(trades_cache_filename(tmp_filename)) + '.')]
+
+    # Changed
+    with open(tmp_filename, 'at') as stream:
+        stream.write('BUY 01/01/2024 CHANGED 1 1 0\n')
+    st, contents = read_file(tmp_filename)
+    assert read_trades_cache(tmp_filename, st, contents) is None
+
+    calculator = Calculator()
+    calculator.parse_file(tmp_filename)
+    assert 'CHANGED' in calculator.securities
+    calculator = Calculator()
+    calculator.parse_file(tmp_filename)
+    assert 'CHANGED' in calculator.securities
+
+
+def test_trades_cache_modified(tmp_path) -> None:
+    filename = str(tmp_path / 'trades.tsv')
+    with open(filename, 'wt') as stream:
+        stream.write('BUY 01/01/2024 FOO 10 1.5 0\n')
+    st, contents = read_file(filename)
+    trades = list(parse_trades(io.StringIO(contents.decode())))
+
+    # Modified between parsing and caching
+    with open(filename, 'at') as stream:
+        stream.write('BUY 01/01/2024 BAR 10 1.5 0\n')
+    write_trades_cache(filename, st, contents, trades)
+
+    st, contents = read_file(filename)
+    assert read_trades_cache(filename, st, contents) is None
+    calculator = Calculator()
+    calculator.parse_file(filename)
+    assert sorted(calculator.securities) == ['BAR', 'FOO']
+
+
+def test_trades_cache_corrupt(tmp_path) -> None:
+    filename = str(tmp_path / 'trades.tsv')
+    with open(filename, 'wt') as stream:
+        stream.write('BUY 01/01/2024 FOO 10 1.5 0\n')
+
+    calculator = Calculator()
+    calculator.parse_file(filename)
+    cache_filename = trades_cache_filename(filename)
+    assert os.path.exists(cache_filename)
+
+    with open(cache_filename, 'r+b') as stream:
+        stream.truncate(os.path.getsize(cache_filename) - 1)
+    st, contents = read_file(filename)
+    assert read_trades_cache(filename, st, contents) is None
+
+    calculator = Calculator()
+    calculator.parse_file(filename)
+    assert [str(param) for param in calculator.securities['FOO'][0].params] == ['10', '1.5', '0']
+
+
+def split_trades(filename:str) -> tuple[list[str], list[tuple[datetime.date, str]]]:
+    header = []
+    lines = []
+    for line in open(filename, 'rt'):
+        row = line.split()
+        if not row or line.startswith('#'):
+            header.append(line)
+        else:
+            date = datetime.datetime.strptime(row[1], "%d/%m/%Y").date()
+            lines.append((date, line))
+    return header, lines
+
+
+def calculate_report(calculator:Calculator, *streams:typing.TextIO) -> str:
+    for stream in streams:
+        calculator.parse(stream)
+    result = calculator.calculate()
+    output = io.StringIO()
+    result.write(TextReport(output))
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("filename", collect_filenames(no_raises=True))
+def test_incremental(filename:str) -> None:
+    _, _, rounding = read_test_annotations(filename)
+
+    header, lines = split_trades(filename)
+    dates = sorted({date for date, _ in lines})
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        expected = calculate_report(Calculator(rounding=rounding), open(filename, 'rt'))
+
+        for cut in dates[::max(len(dates) // 8, 1)]:
+            before = ''.join(header + [line for date, line in lines if date <= cut])
+            after = ''.join([line for date, line in lines if date > cut])
+
+            calculator = Calculator(rounding=rounding)
+            try:
+                calculate_report(calculator, io.StringIO(before))
+            except ValueError:
+                # Bed and breakfast may require later trades
+                continue
+            state = io.BytesIO()
+            calculator.save(state)
+
+            state.seek(0)
+            calculator = Calculator(rounding=rounding)
+            calculator.load(state)
+            assert calculate_report(calculator, io.StringIO(after)) == expected
+
+            # Further calculations give the same result
+            assert calculate_report(calculator) == expected
+
+            # Out of order trades require starting afresh
+            calculator = Calculator(rounding=rounding)
+            try:
+                calculate_report(calculator, io.StringIO(after))
+            except (AssertionError, ValueError):
+                # Later trades aren't always valid on their own
+                continue
+            assert calculate_report(calculator, io.StringIO(before)) == expected
+
+    state = io.BytesIO()
+    Calculator(rounding=rounding).save(state)
+    state.seek(0)
+    with pytest.raises(ValueError):
+        Calculator(rounding=not rounding).load(state)
+
+
+def test_parallel() -> None:
+    filenames = [os.path.join(data_dir, 'cgtcalc', name) for name in ('jameshay-example.tsv', 'html-escape.tsv', 'warning-dividend-holding.tsv')]
+
+    outputs = []
+    for max_workers in (1, 2):
+        calculator = Calculator()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for filename in filenames:
+                calculator.parse(open(filename, 'rt'))
+            result = calculator.calculate(max_workers=max_workers)
+        output = io.StringIO()
+        result.write(TextReport(output))
+        outputs.append((output.getvalue(), [str(w.message) for w in caught]))
+
+    assert outputs[0] == outputs[1]
+    assert any('expected holding of 10 FOO' in message for message in outputs[1][1])
+
+
+@dataclasses.dataclass
+class SingleField:
+    amount: Decimal
+
+
+@pytest.mark.parametrize("cls", [TextReport, HtmlReport])
+def test_write_table_single_field(cls) -> None:
+    output = io.StringIO()
+    Result().write_table(cls(output), [SingleField(Decimal('1.25')), SingleField(Decimal('-3'))])
+    assert '1.25' in output.getvalue()
+    assert '-3' in output.getvalue()
+
+
 @pytest.mark.parametrize("filename", collect_filenames(no_raises=True))
 def test_report_html(filename:str) -> None:
     _, _, rounding = read_test_annotations(filename)
@@ -5,11 +5,15 @@
 #
 
 
+import contextlib
+import email.utils
+import http.server
 import os
 import pytest
 import socket
 import subprocess
 import sys
+import threading
 import time
 import urllib.parse
 import urllib.error
@@ -17,6 +21,8 @@ import urllib.request
 
 from filelock import FileLock
 
+import download as download_module
+
 from download import download
 
 
@@ -183,3 +189,217 @@ def test_main(httpbun:str, tmp_path) -> None:
 
     subprocess.check_call([sys.executable, download_path, url, filename])
     assert filename.is_file()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Serve a versioned resource, honouring conditional requests."""
+
+    version = 1
+    status = 200
+    delay = 0.0
+    requests:list[dict[str, str]] = []
+
+    # Number of clients that must connect to /ready before the resource is served
+    clients = 0
+    ready = 0
+    all_ready = threading.Event()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        if self.path == '/ready':
+            with cls.lock:
+                cls.ready += 1
+                if cls.ready == cls.clients:
+                    cls.all_ready.set()
+            self.send_response(204)
+            self.end_headers()
+            return
+        cls.requests.append(dict(self.headers))
+        if cls.clients:
+            assert cls.all_ready.wait(timeout=60)
+        time.sleep(cls.delay)
+        if cls.status != 200:
+            self.send_error(cls.status)
+            return
+        etag = f'"v{cls.version}"'
+        last_modified = email.utils.formatdate(1700000000 + cls.version, usegmt=True)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if self.headers.get('If-None-Match') == etag or \
+           'If-None-Match' not in self.headers and if_modified_since is not None and \
+           email.utils.parsedate_to_datetime(if_modified_since) >= email.utils.parsedate_to_datetime(last_modified):
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f'version {cls.version}\n'.encode('ascii')
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubHandler.version = 1
+    StubHandler.status = 200
+    StubHandler.delay = 0.0
+    StubHandler.requests = []
+    StubHandler.clients = 0
+    StubHandler.ready = 0
+    StubHandler.all_ready = threading.Event()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/resource.txt'
+    download_module.wait()
+    server.shutdown()
+    server.server_close()
+
+
+def test_conditional(stub_url:str, tmp_path) -> None:
+    filename = tmp_path / 'resource.txt'
+
+    download(stub_url, filename)
+    assert filename.read_text() == 'version 1\n'
+    assert 'If-None-Match' not in StubHandler.requests[-1]
+
+    # Not modified
+    mtime = filename.stat().st_mtime
+    download(stub_url, filename)
+    assert StubHandler.requests[-1]['If-None-Match'] == '"v1"'
+    assert StubHandler.requests[-1]['If-Modified-Since'] == email.utils.formatdate(1700000001, usegmt=True)
+    assert filename.stat().st_mtime == mtime
+
+    # Modified
+    StubHandler.version = 2
+    download(stub_url, filename)
+    assert filename.read_text() == 'version 2\n'
+
+    # Under TTL
+    download(stub_url, filename, ttl=60)
+    assert len(StubHandler.requests) == 3
+
+
+def test_no_metadata(stub_url:str, tmp_path) -> None:
+    # A copy downloaded before metadata was saved alongside
+    filename = tmp_path / 'resource.txt'
+    filename.write_text('version 1\n')
+    os.utime(filename, (1700000001, 1700000001))
+
+    # Revalidated with If-Modified-Since alone
+    download(stub_url, filename, ttl=3600)
+    assert 'If-None-Match' not in StubHandler.requests[-1]
+    assert StubHandler.requests[-1]['If-Modified-Since'] == email.utils.formatdate(1700000001, usegmt=True)
+    assert (tmp_path / '.resource.txt.meta').is_file()
+
+    # And the TTL respected thereafter
+    download(stub_url, filename, ttl=3600)
+    download(stub_url, filename, ttl=3600, stale=True)
+    download_module.wait()
+    assert len(StubHandler.requests) == 1
+    assert filename.read_text() == 'version 1\n'
+
+
+def test_stale(stub_url:str, tmp_path) -> None:
+    filename = tmp_path / 'resource.txt'
+
+    download(stub_url, filename, ttl=60, stale=True)
+    assert filename.read_text() == 'version 1\n'
+
+    # Stale copies are served immediately
+    StubHandler.version = 2
+    StubHandler.delay = 0.5
+    start = time.perf_counter()
+    download(stub_url, filename, stale=True)
+    download(stub_url, filename, stale=True)
+    assert time.perf_counter() - start < StubHandler.delay
+    assert filename.read_text() == 'version 1\n'
+
+    # And revalidated once in the background
+    download_module.wait()
+    assert filename.read_text() == 'version 2\n'
+    assert len(StubHandler.requests) == 2
+
+    # Errors while revalidating are tolerated
+    StubHandler.delay = 0.0
+    StubHandler.status = 500
+    download(stub_url, filename, stale=True)
+    download_module.wait()
+    assert filename.read_text() == 'version 2\n'
+    assert len(StubHandler.requests) == 3
+
+
+def _signal_ready(single_flight, ready_url:str):
+    """Wrap _single_flight, to tell the stub when a client is about to wait."""
+
+    @contextlib.contextmanager
+    def wrapper(filename:str):
+        urllib.request.urlopen(ready_url).close()
+        with single_flight(filename):
+            yield
+
+    return wrapper
+
+
+def test_single_flight_threads(stub_url:str, tmp_path, monkeypatch) -> None:
+    filename = tmp_path / 'resource.txt'
+    lock_dir = tmp_path / 'locks'
+    clients = 8
+
+    # Only serve once every client waits
+    StubHandler.clients = clients
+    monkeypatch.setattr(download_module, 'lock_dir', str(lock_dir))
+    monkeypatch.setattr(download_module, '_single_flight', _signal_ready(download_module._single_flight, urllib.parse.urljoin(stub_url, '/ready')))
+
+    threads = [threading.Thread(target=download, args=(stub_url, filename)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert StubHandler.ready == clients
+    assert len(StubHandler.requests) == 1
+    assert filename.read_text() == 'version 1\n'
+
+    # No lock files are left alongside
+    assert sorted(os.listdir(tmp_path)) == ['.resource.txt.meta', 'locks', 'resource.txt']
+    assert len(os.listdir(lock_dir)) == 1
+
+
+_single_flight_process = """
+import sys
+
+sys.path[:0] = sys.argv[1:3]
+
+import download
+
+from test_download import _signal_ready
+
+download._single_flight = _signal_ready(download._single_flight, sys.argv[3])
+download.download(sys.argv[4], sys.argv[5])
+"""
+
+
+def test_single_flight_processes(stub_url:str, tmp_path) -> None:
+    filename = tmp_path / 'resource.txt'
+    clients = 4
+
+    # Only serve once every client waits
+    StubHandler.clients = clients
+
+    from download import __file__ as download_path
+
+    paths = [os.path.dirname(os.path.abspath(download_path)), os.path.dirname(os.path.abspath(__file__))]
+    args = paths + [urllib.parse.urljoin(stub_url, '/ready'), stub_url, str(filename)]
+    processes = [subprocess.Popen([sys.executable, '-c', _single_flight_process] + args) for _ in range(clients)]
+    for process in processes:
+        assert process.wait() == 0
+
+    assert StubHandler.ready == clients
+    assert len(StubHandler.requests) == 1
+    assert filename.read_text() == 'version 1\n'
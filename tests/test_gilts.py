@@ -12,9 +12,12 @@ import logging
 import math
 import operator
 import os.path
+import re
+import shutil
 import subprocess
 import sys
 
+import pandas as pd
 import pytest
 
 from pytest import approx
@@ -25,7 +28,7 @@ from typing import cast
 import matplotlib.pyplot as plt
 
 from data.rpi import RPI
-from gilts.gilts import logger, Gilt, IndexLinkedGilt, Issued, GiltPrices, yield_curve
+from gilts.gilts import logger, Gilt, IndexLinkedGilt, Issued, GiltPrices, GiltBook, yield_curve
 from gilts.ladder import BondLadder, schedule
 from ukcalendar import is_business_day, next_business_day, shift_month, shift_year
 
@@ -45,12 +48,106 @@ def test_ex_dividend_date(coupon_date, xd_date):
     assert Gilt.ex_dividend_date(coupon_date) == xd_date
 
 
+def coupon_dates_reference(gilt, settlement_date):
+    next_coupon_dates = []
+    prev_coupon_date = gilt.maturity
+    periods = 0
+    while (prev_coupon_date - gilt.issue_date).days >= gilt.min_coupon_days:
+        next_coupon_dates.append(prev_coupon_date)
+        periods += 1
+        prev_coupon_date = shift_month(gilt.maturity, -6*periods)
+        if prev_coupon_date < settlement_date:
+            break
+    next_coupon_dates.reverse()
+    return prev_coupon_date, next_coupon_dates
+
+
+def test_coupon_dates(issued):
+    for gilt in issued.all:
+        settlement_date = gilt.issue_date
+        while settlement_date <= gilt.maturity:
+            prev_coupon_date, next_coupon_dates = gilt.coupon_dates(settlement_date)
+            assert (prev_coupon_date, next_coupon_dates) == coupon_dates_reference(gilt, settlement_date)
+            assert gilt.prev_next_coupon_date(settlement_date) == (prev_coupon_date, next_coupon_dates[0])
+            settlement_date += datetime.timedelta(days=17)
+        assert gilt.final_ex_dividend_date() == Gilt.ex_dividend_date(gilt.maturity)
+
+
 @pytest.fixture
 def issued(scope='module'):
     rpi_filename = os.path.join(data_dir, 'rpi-series-20231115.csv')
     rpi_series = RPI(rpi_filename)
     filename = os.path.join(data_dir, 'dmo-D1A-20231201.xml')
-    return Issued(filename, rpi_series=rpi_series)
+    # Always parse, so that ex-dividend dates are checked
+    return Issued(filename, rpi_series=rpi_series, cache=False)
+
+
+def test_issued_snapshot(tmp_path, monkeypatch):
+    rpi_series = RPI(os.path.join(data_dir, 'rpi-series-20231115.csv'))
+    filename = str(tmp_path / 'dmo-D1A.xml')
+    shutil.copyfile(os.path.join(data_dir, 'dmo-D1A-20231201.xml'), filename)
+    snapshot_filename = str(tmp_path / '.dmo-D1A.xml.issued')
+
+    issued = Issued(filename, rpi_series=rpi_series, cache=False)
+    assert not os.path.exists(snapshot_filename)
+
+    def attributes(issued):
+        return [(type(g), g.name, g.isin, g.coupon, g.maturity, g.issue_date, g._schedule, getattr(g, 'base_rpi', None)) for g in issued.all]
+
+    expected = attributes(issued)
+
+    Issued(filename, rpi_series=rpi_series)
+    assert os.path.exists(snapshot_filename)
+
+    # Load from the snapshot
+    with monkeypatch.context() as m:
+        def parse(entries):
+            raise AssertionError
+        m.setattr(Issued, '_parse', staticmethod(parse))
+        issued = Issued(filename, rpi_series=rpi_series)
+    assert attributes(issued) == expected
+    assert issued.close_date == datetime.date(2023, 12, 1)
+    index_linked = [gilt for gilt in issued.all if isinstance(gilt, IndexLinkedGilt)]
+    assert index_linked
+    for gilt in index_linked:
+        assert gilt.rpi_series is rpi_series
+
+    # Changes to the source invalidate the snapshot
+    with open(filename, 'ab') as stream:
+        stream.write(b'\n')
+    os.utime(snapshot_filename, (0, 0))
+    issued = Issued(filename, rpi_series=rpi_series)
+    assert attributes(issued) == expected
+    assert os.path.getmtime(snapshot_filename) != 0
+
+    # Corrupt snapshots are ignored
+    with open(snapshot_filename, 'wb') as stream:
+        stream.write(b'garbage')
+    issued = Issued(filename, rpi_series=rpi_series)
+    assert attributes(issued) == expected
+
+    # Replacing the source while it's parsed doesn't taint the snapshot
+    with open(filename, 'rb') as source:
+        data = source.read()
+    start = data.index(b'<View_GILTS_IN_ISSUE ')
+    end = data.index(b'/>', start) + len(b'/>')
+    mo = re.search(rb'ISIN_CODE="([^"]*)"', data[start:end])
+    assert mo
+    removed = mo.group(1).decode('ascii')
+    data = data[:start] + data[end:]
+    os.unlink(snapshot_filename)
+    with monkeypatch.context() as m:
+        parse = Issued._parse
+        def parse_and_replace(entries):
+            result = parse(entries)
+            with open(filename, 'wb') as stream:
+                stream.write(data)
+            return result
+        m.setattr(Issued, '_parse', staticmethod(parse_and_replace))
+        issued = Issued(filename, rpi_series=rpi_series)
+        assert attributes(issued) == expected
+    issued = Issued(filename, rpi_series=rpi_series)
+    assert attributes(issued) == [a for a in expected if a[2] != removed]
 
 
 gilts_closing_prices_csv = os.path.join(data_dir, 'gilts-closing-prices-20231201.csv')
@@ -92,6 +189,29 @@ def test_yield_curve(issued, prices, index_linked, show_plots):
         plt.savefig(os.devnull, format='svg')
 
 
+@pytest.mark.parametrize("index_linked", [False, True, None])
+def test_gilt_book(issued, prices, index_linked):
+    settlement_date = next_business_day(issued.close_date)
+    gilts = list(issued.filter(index_linked, settlement_date))
+    book = GiltBook(gilts, settlement_date)
+    assert len(book) == len(gilts)
+
+    clean_prices = [prices.get_price(prices.lookup_tidm(g.isin)) for g in gilts]
+    dirty_prices = book.dirty_prices(clean_prices)
+    assert book.clean_prices(dirty_prices) == approx(clean_prices, abs=1e-9)
+
+    ytms = book.ytm(dirty_prices)
+    for g, clean_price, dirty_price, ytm in zip(gilts, clean_prices, dirty_prices, ytms):
+        assert dirty_price == approx(g.dirty_price(clean_price, settlement_date), abs=1e-9)
+        assert ytm == approx(g.ytm(dirty_price, settlement_date), abs=1e-9)
+
+
+def test_gilt_book_empty():
+    book = GiltBook([], datetime.date(2023, 12, 4))
+    assert len(book) == 0
+    assert book.ytm(book.dirty_prices([])).shape == (0,)
+
+
 @pytest.fixture
 def tradeweb_issued(scope='module'):
     entries = {}
@@ -480,6 +600,18 @@ def test_il_cash_flows(issued, entry):
     raise AssertionError(f'{name} not found')
 
 
+@pytest.mark.parametrize("inflation_rate", [0.00, 0.03, 0.05])
+def test_il_ref_rpis(issued, inflation_rate):
+    settlement_date = next_business_day(datetime.date(2023, 12, 8))
+    for gilt in issued.filter(index_linked=True, settlement_date=settlement_date):
+        dates = [settlement_date + datetime.timedelta(days=days) for days in range(0, 365*60, 13)]
+        dates = [date for date in dates if date <= gilt.maturity]
+        ref_rpis = gilt.ref_rpis(dates, inflation_rate=inflation_rate)
+        assert ref_rpis.tolist() == [gilt.ref_rpi(date, inflation_rate=inflation_rate) for date in dates]
+        index_ratios = gilt.index_ratios(dates, inflation_rate=inflation_rate)
+        assert index_ratios.tolist() == [gilt.index_ratio(date, inflation_rate=inflation_rate) for date in dates]
+
+
 # Estimated Redemption Payments for Index-linked Gilts, taken from
 # https://www.dmo.gov.uk/data/pdfdatareport?reportCode=D9C
 # on 2023-12-08 with assumed inflation rates of 0% and 3%
@@ -592,6 +724,50 @@ def test_bond_ladder(issued, prices, count, amount, shift, index_linked, margina
     assert income <= incoming + .005
 
 
+@pytest.mark.parametrize("lag", [0, 24])
+@pytest.mark.parametrize("index_linked", [False, True])
+def test_bond_ladder_resolve(issued, prices, index_linked, lag):
+    s = schedule(20, 10000, shift_year)
+    today = prices.get_prices_date().date()
+
+    def bond_ladder(prices):
+        bl = BondLadder(issued=issued, prices=prices, schedule=s)
+        bl.index_linked = index_linked
+        bl.marginal_income_tax = 0.40
+        bl.interest_rate = 0.02
+        bl.lag = lag
+        bl.today = today
+        return bl
+
+    bl = bond_ladder(prices)
+    bl.solve()
+    model = bl._model
+    assert model is not None
+
+    # Perturb the prices
+    new_prices = GiltPrices()
+    for isin, tidm in prices.tidms.items():
+        if tidm in prices.prices:
+            price = prices.prices[tidm] * (1.0 + 0.01 * math.sin(len(new_prices.prices)))
+            new_prices.add_price(prices.datetime, isin, tidm, price)
+
+    bl.prices = new_prices
+    bl.solve()
+    assert bl._model is model
+
+    expected = bond_ladder(new_prices)
+    expected.solve()
+    assert bl.cost == approx(expected.cost)
+    assert bl.yield_ == approx(expected.yield_)
+    pd.testing.assert_frame_equal(bl.buy_df, expected.buy_df)
+    pd.testing.assert_frame_equal(bl.cash_flow_df, expected.cash_flow_df, atol=1e-6)
+
+    # Changing anything else rebuilds the model
+    bl.interest_rate = 0.0
+    bl.solve()
+    assert bl._model is not model
+
+
 def test_ladder_main():
     cmd = [
         sys.executable, '-m',
@@ -272,6 +272,42 @@ def test_variables_dict():
     assert vd['y'] is y
 
 
+def test_sum():
+    x = lp.LpVariable("x", xv)
+    y = lp.LpVariable("y", yv)
+    z = lp.LpVariable("z", zv)
+    e = lp.lpSum([x, 2*y, x + z, 1.0, -y])
+    prob = lp.LpProblem()
+    prob += e
+    status = prob.solve()
+    assert status == lp.LpStatusOptimal
+    assert lp.value(e) == 2*xv + yv + zv + 1.0
+    assert lp.value(lp.lpSum([])) == 0.0
+
+
+def test_resolve():
+    # Create variables out of order, to exercise column mapping
+    y = lp.LpVariable("y", 0, None)
+    x = lp.LpVariable("x", 0, 3)
+    w = lp.LpVariable("w", 0, 1)
+    prob = lp.LpProblem()
+    prob += x + y <= 2
+    prob += x - y >= -1
+    prob += -4*x + y
+    status = prob.solve()
+    assert status == lp.LpStatusOptimal
+    assert lp.value(x) == 2.0
+    assert lp.value(y) == 0.0
+
+    prob += x == 1
+    prob += -x - y - w
+    status = prob.solve()
+    assert status == lp.LpStatusOptimal
+    assert lp.value(x) == 1.0
+    assert lp.value(y) == 1.0
+    assert lp.value(w) == 1.0
+
+
 @pytest.mark.skipif(pulp, reason="PuLP")
 def test_inplace():
     z = lp.LpVariable("z", 0, None)
@@ -6,9 +6,13 @@
 
 
 import csv
+import http.server
 import io
+import json
 import subprocess
 import sys
+import threading
+import time
 import types
 
 import pytest
@@ -66,6 +70,73 @@ def test_get_instrument_data_error() -> None:
         _ = lse.get_instrument_data(tidm)
 
 
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Serve instrument data, failing in a few predetermined ways."""
+
+    prefix = '/api/gw/lse/instruments/alldata/'
+    requests:dict[str, int] = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        assert self.path.startswith(self.prefix)
+        tidm = self.path[len(self.prefix):]
+        with self.lock:
+            count = self.requests.get(tidm, 0) + 1
+            self.requests[tidm] = count
+        if tidm == 'FLKY' and count == 1:
+            self.reply(503, {'message': 'Service Unavailable'})
+        elif tidm == 'SLOW':
+            time.sleep(0.5)
+            self.reply(200, {'tidm': tidm, 'lastprice': 1.0})
+        elif tidm == 'DOWN':
+            self.reply(500, {'message': 'Internal Server Error'})
+        elif tidm == 'NONE':
+            self.reply(404, {'message': 'Not Found'})
+        else:
+            self.reply(200, {'tidm': tidm, 'lastprice': 100.0})
+
+    def reply(self, status:int, obj:dict) -> None:
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    StubHandler.requests = {}
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(lse, 'api_url', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setattr(lse, 'timeout', 0.25)
+    yield StubHandler.requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_instruments_data(stub_server) -> None:
+    tidms = [f'T{i:03d}' for i in range(32)] + ['FLKY', 'SLOW', 'DOWN', 'NONE']
+    data = lse.get_instruments_data(tidms, max_workers=4, retries=2, backoff=0.01)
+
+    # Partial results
+    assert set(data) == set(tidms) - {'SLOW', 'DOWN', 'NONE'}
+    for tidm, obj in data.items():
+        assert obj == {'tidm': tidm, 'lastprice': 100.0}
+
+    # Transient errors are retried, but permanent ones are not
+    assert stub_server['T000'] == 1
+    assert stub_server['FLKY'] == 2
+    assert stub_server['DOWN'] == 3
+    assert stub_server['SLOW'] == 3
+    assert stub_server['NONE'] == 1
+
+
 def test_get_latest_gilt_prices() -> None:
     dt, content = lse.get_latest_gilt_prices()
     for instrument in content:
@@ -6,10 +6,11 @@
 import subprocess
 import sys
 
+import numpy as np
 import pytest
 
 
-from nsandi_premium_bonds import binomial, Calculator
+from nsandi_premium_bonds import binomial, combine, Calculator
 
 
 # https://www.nsandi.com/products/premium-bonds
@@ -38,6 +39,17 @@ def test_binomial() -> None:
     assert binomial(4, 6, 0.3) == pytest.approx(0.059535, abs=1e-6)
 
 
+def test_combine() -> None:
+    rng = np.random.default_rng(0)
+    N = 100
+    dist0 = rng.random(N)
+    dist1 = rng.random(N)
+    expected = np.zeros(N)
+    for i in range(N):
+        expected[i:] += dist0[i]*dist1[:N - i]
+    assert combine(dist0, dist1) == pytest.approx(expected)
+
+
 @pytest.mark.parametrize('n', amounts)
 def test_median(n:int) -> None:
     N = 512*1024
@@ -45,6 +57,37 @@ def test_median(n:int) -> None:
     assert c.median(n) == pytest.approx(c.median_mc(n, N), abs=1e-4)
 
 
+def test_median_mc_seed() -> None:
+    c = Calculator(odds, prizes, desc)
+    c.task_size = 16*1024
+    N = 3*c.task_size + 7
+
+    hist = c.histogram(1e-6, np.random.SeedSequence(0), N)
+    assert hist.sum() == N
+
+    # Reproducible, regardless of the number of workers
+    m = c.median_mc(5000, N, seed=1, max_workers=1)
+    assert c.median_mc(5000, N, seed=1, max_workers=2) == m
+    assert m == c.median(5000)
+
+
+def test_median_curve() -> None:
+    c = Calculator(odds, prizes, desc)
+    curve = c.median_curve(quantiles=(.25, .5, .75))
+    assert curve.n[0] == 25
+    assert curve.n[-1] == 50000
+    assert curve.values.shape == (len(curve.n), 3)
+    for n in amounts + [1000, 12525, 33350]:
+        i, = (curve.n == n).nonzero()[0]
+        assert curve.median[i] == c.median(n)
+        assert curve.values[i, 1] == curve.median[i]
+    assert np.all(np.diff(curve.values, axis=1) >= 0)
+    assert np.all(np.diff(curve.p_zero) < 0)
+
+    p = 1 / c.total_bonds
+    assert curve.p_zero[0] == pytest.approx((1 - p) ** (12 * c.total_volume))
+
+
 # Test cases from tests.txt
 _prizes_cases = [
     # https://nsandi-corporate.com/news-research/news/nsi-reduces-prize-fund-rate-and-lengthens-odds-premium-bonds
@@ -0,0 +1,52 @@
+#
+# Copyright (c) 2025 LateGenXer
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+
+import io
+
+from decimal import Decimal
+
+import pytest
+
+from report import TextReport, HtmlReport
+
+
+rows = [
+    ['Foo', Decimal('1.5'), None],
+    ['Bar <baz>', Decimal('-10'), float('NaN')],
+]
+
+
+@pytest.mark.parametrize("cls", [TextReport, HtmlReport])
+def test_write_table_iterable(cls) -> None:
+    outputs = []
+    for table in (rows, iter(rows), (row for row in rows)):
+        stream = io.StringIO()
+        report = cls(stream)
+        report.write_table(table, header=['Name', 'Value', 'Note'], footer=['Total', Decimal('-8.5'), ''], just='lrl', indent='  ')
+        outputs.append(stream.getvalue())
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert 'Bar' in outputs[0]
+
+
+def test_write_table_text() -> None:
+    stream = io.StringIO()
+    report = TextReport(stream)
+    report.write_table(rows, header=['Name', 'Value', 'Note'], footer=['Total', Decimal('-8.5'), ''], just='lrl')
+    assert stream.getvalue() == (
+        'Name       Value  Note\n'
+        '──────────────────────\n'
+        'Foo          1.5\n'
+        'Bar <baz>    -10\n'
+        '──────────────────────\n'
+        'Total       -8.5\n'
+        '\n'
+    )
+
+    stream = io.StringIO()
+    report = TextReport(stream)
+    report.write_table([], header=['Name', 'Value'], just='lr')
+    assert stream.getvalue() == 'Name  Value\n───────────\n\n'
@@ -9,6 +9,7 @@ import os.path
 
 from datetime import date
 
+import numpy as np
 import pytest
 
 from pytest import approx
@@ -61,3 +62,28 @@ def test_rpi_superseded() -> None:
     filename = os.path.join(os.path.dirname(__file__), 'data', 'rpi-series-20231115.csv')
     with pytest.raises(OutOfDateError):
         series, release_date = RPI.parse(filename)
+
+
+def test_rpi_extrapolate_from_indices() -> None:
+    filename = os.path.join(os.path.dirname(__file__), 'data', 'rpi-series-20231115.csv')
+    rpi = RPI(filename)
+    n = len(rpi.series)
+
+    # Reference implementation
+    def extrapolate_from_index(month_idx:int, inflation_rate:float) -> float:
+        if month_idx < n:
+            return rpi.series[month_idx]
+        return rpi.series[-1] * (1 + inflation_rate) ** ((month_idx + 1 - n) / 12)
+
+    month_idx = np.arange(0, n + 12*100, 7)
+    for inflation_rate in (0.0, 0.03, -0.01):
+        expected = [extrapolate_from_index(i, inflation_rate) for i in month_idx.tolist()]
+        assert [rpi.extrapolate_from_index(i, inflation_rate) for i in month_idx.tolist()] == expected
+        assert rpi.extrapolate_from_indices(month_idx, inflation_rate).tolist() == expected
+
+    # Extending the series invalidates extrapolations
+    d0 = rpi.last_date()
+    d1 = d0.replace(year=d0.year + 1)
+    rpi.extend([rpi.latest() * 2])
+    assert rpi.lookup(rpi.last_date()) == rpi.latest()
+    assert rpi.extrapolate(d1, .00) == rpi.latest()
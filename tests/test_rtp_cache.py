@@ -0,0 +1,93 @@
+#
+# Copyright (c) 2025 LateGenXer
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+
+import os
+
+import pytest
+
+from rtp import cache, model
+
+from test_rtp_model import model_params
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    calls = []
+
+    def fake_model(**params):
+        calls.append(params)
+        return model.Result(retirement_income_net=params['inflation_rate'])
+
+    monkeypatch.setattr(model, 'model', fake_model)
+    return calls
+
+
+def test_key():
+    params = model_params()
+    assert cache.key(params) == cache.key(dict(params))
+    assert cache.key(params) == cache.key(params | {"sipp_2": 0.0})
+    assert cache.key(params) == cache.key(dict(reversed(params.items())))
+    assert cache.key(params) != cache.key(params | {"inflation_rate": 3e-2})
+    assert cache.key(params) != cache.key(params | {"joint": True})
+    with pytest.raises(TypeError):
+        cache.key(params | {"inflation_rate": object()})
+
+
+def test_lru(model_calls):
+    c = cache.ResultCache(maxsize=2)
+    params = [model_params() | {"inflation_rate": i * 1e-2} for i in range(3)]
+
+    r0 = c.run(params[0])
+    assert c.run(params[0]) is r0
+    c.run(params[1])
+    assert len(model_calls) == 2
+
+    # Touch the first, so that the second is evicted
+    c.run(params[0])
+    c.run(params[2])
+    assert len(c) == 2
+    assert len(model_calls) == 3
+    assert c.run(params[0]) is r0
+    assert len(model_calls) == 3
+    c.run(params[1])
+    assert len(model_calls) == 4
+
+
+def test_directory(tmp_path, model_calls):
+    directory = str(tmp_path)
+    params = [model_params() | {"inflation_rate": i * 1e-2} for i in range(3)]
+
+    c = cache.ResultCache(directory=directory, max_files=2)
+    result = c.run(params[0])
+    assert len(model_calls) == 1
+
+    # Results persist across instances
+    c = cache.ResultCache(directory=directory, max_files=2)
+    assert c.run(params[0]) == result
+    assert len(model_calls) == 1
+
+    c.run(params[1])
+    os.utime(os.path.join(directory, f'{cache.key(params[0])}.pickle'), (0, 0))
+    c.run(params[2])
+    assert len(os.listdir(directory)) == 2
+    assert not os.path.exists(os.path.join(directory, f'{cache.key(params[0])}.pickle'))
+
+    # Corrupt files are ignored
+    with open(os.path.join(directory, f'{cache.key(params[1])}.pickle'), 'wb') as stream:
+        stream.write(b'garbage')
+    c.clear()
+    c.run(params[1])
+    assert len(model_calls) == 4
+
+
+def test_model(tmp_path):
+    params = model_params()
+    c = cache.ResultCache(directory=str(tmp_path))
+    result = c.run(params)
+    assert result == model.model(**params)
+    c.clear()
+    assert cache.ResultCache(directory=str(tmp_path)).run(params) == result
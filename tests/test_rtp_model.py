@@ -1,3 +1,4 @@
+import concurrent.futures
 import datetime
 
 import pytest
@@ -20,7 +21,13 @@ import lp
     pytest.param(True, True, id="marriage_allowance"),
 ])
 def test_model(joint, sipp_extra_contrib, retirement_country, retirement_income_net, lump_sum, marriage_allowance):
-    params = {
+    params = model_params(joint, sipp_extra_contrib, retirement_country, retirement_income_net, lump_sum, marriage_allowance)
+
+    model.run(params)
+
+
+def model_params(joint=False, sipp_extra_contrib=False, retirement_country='UK', retirement_income_net=0, lump_sum=0, marriage_allowance=False):
+    return {
         "joint": joint,
         "dob_1": 1980,
         "dob_2": 1981,
@@ -60,7 +67,30 @@ def test_model(joint, sipp_extra_contrib, retirement_country, retirement_income_
         "end_age": 100,
     }
 
-    model.run(params)
+
+def test_model_batch():
+    params_list = [
+        model_params(),
+        model_params(joint=True) | {"inflation_rate": 3.5e-2},
+        model_params(lump_sum=1000) | {"retirement_year": 2040},
+    ]
+    results = model.model_batch(params_list, max_workers=2)
+    assert len(results) == len(params_list)
+    for params, result in zip(params_list, results):
+        expected = model.model(**params)
+        assert result.retirement_income_net == pytest.approx(expected.retirement_income_net)
+        assert result.net_worth_end == pytest.approx(expected.net_worth_end)
+        assert len(result.data) == len(expected.data)
+
+    assert model.model_batch([]) == []
+
+
+def test_model_threads():
+    params_list = [model_params(joint=joint, retirement_income_net=retirement_income_net) for joint in (False, True) for retirement_income_net in (0, 10000)]
+    expected = [model.model(**params) for params in params_list]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(params_list)) as executor:
+        results = list(executor.map(lambda params: model.model(**params), params_list))
+    assert results == expected
 
 
 @pytest.mark.parametrize("income,income_tax,cg,cgt,ma", [
@@ -8,6 +8,7 @@
 import json
 import runpy
 
+import numpy as np
 import pytest
 
 from datetime import date, MINYEAR, MAXYEAR
@@ -69,6 +70,23 @@ def test_business_days(dp:date, d0:date, dn:date, b:bool) -> None:
     assert is_business_day(d0) is b
 
 
+@pytest.mark.parametrize("n", [-7, -2, -1, 0, 1, 2, 7])
+@pytest.mark.parametrize("start,stop", [
+    ((2004,  8,  1), (2004, 10,  1)),
+    ((1997, 12,  1), (1998,  2,  1)),  # before the table
+    ((2119, 12,  1), (2120,  2,  1)),  # after the table
+], ids=repr)
+def test_add_business_days(n:int, start:tuple[int, int, int], stop:tuple[int, int, int]) -> None:
+    dates = [date.fromordinal(o) for o in range(date(*start).toordinal(), date(*stop).toordinal())]
+    results = add_business_days_array(dates, n)
+    for d0, d1 in zip(dates, results):
+        expected = d0
+        for _ in range(abs(n)):
+            expected = next_business_day(expected) if n > 0 else prev_business_day(expected)
+        assert add_business_days(d0, n) == expected
+        assert d1 == np.datetime64(expected)
+
+
 @pytest.mark.parametrize("d0,n,d1", [
     ((2024, 2, 29),  1, (2025, 2, 28)),
     ((2024, 2, 29),  0, (2024, 2, 29)),
@@ -7,11 +7,12 @@
 
 from datetime import date
 
+import numpy as np
 import pytest
 
 from pytest import approx
 
-from xirr import xnpv, xirr
+from xirr import xnpv, xirr, xnpv_many, xirr_many, pad_series
 
 
 def test_xnpv() -> None:
@@ -55,3 +56,77 @@ def test_xirr_maxiter() -> None:
     dates, values = zip(*transactions)
     irr = xirr(values, dates, guess=0.1)
     assert irr == approx(2.64285575, rel=1e-8)
+
+
+many_series: list[list[tuple[float, date]]] = [
+    [
+        (-10000, date(2008,  1,  1)),
+        (  2750, date(2008,  3,  1)),
+        (  4250, date(2008, 10, 30)),
+        (  3250, date(2009,  2, 15)),
+        (  2750, date(2009,  4,  1)),
+    ],
+    [
+        (-155.3170362032967, date(2024, 3, 19)),
+        (0.098048, date(2024, 3, 22)),
+        (156.876965, date(2024, 3, 22)),
+    ],
+    [
+        (-100, date(2020, 1, 1)),
+        ( 105, date(2021, 1, 1)),
+    ],
+]
+
+
+def test_pad_series() -> None:
+    series_values = [[v for v, d in transactions] for transactions in many_series]
+    series_dates = [[d for v, d in transactions] for transactions in many_series]
+    values, dates = pad_series(series_values, series_dates)
+    assert values.shape == (3, 5)
+    assert dates.shape == (3, 5)
+    assert values[2].tolist() == [-100, 105, 0, 0, 0]
+    assert np.isnat(dates[2, 2:]).all()
+
+
+def test_xnpv_many() -> None:
+    series_values = [[v for v, d in transactions] for transactions in many_series]
+    series_dates = [[d for v, d in transactions] for transactions in many_series]
+    values, dates = pad_series(series_values, series_dates)
+    npvs = xnpv_many(.09, values, dates, period=365.0)
+    for npv, v, d in zip(npvs, series_values, series_dates):
+        assert npv == approx(xnpv(.09, v, d, period=365.0), rel=1e-12)
+
+
+def test_xirr_many() -> None:
+    series_values = [[v for v, d in transactions] for transactions in many_series]
+    series_dates = [[d for v, d in transactions] for transactions in many_series]
+    values, dates = pad_series(series_values, series_dates)
+    irrs = xirr_many(values, dates)
+    for irr, v, d in zip(irrs, series_values, series_dates):
+        assert irr == approx(xirr(v, d), rel=1e-8)
+
+
+def test_xirr_many_empty() -> None:
+    values, dates = pad_series([], [])
+    assert xirr_many(values, dates).shape == (0,)
+
+
+def test_xirr_many_no_solution() -> None:
+    values, dates = pad_series([[-100, 0]], [[date(2020, 1, 1), date(2021, 1, 1)]])
+    irrs = xirr_many(values, dates)
+    assert np.isnan(irrs[0])
+
+
+def test_xirr_many_invalid() -> None:
+    d0, d1, d2 = date(2020, 1, 1), date(2021, 1, 1), date(2022, 1, 1)
+
+    # Same sign cash flows, regardless of padding
+    for series_values in ([[-100, 105], [100, 105, 110]], [[-100, 105], [-100, -105, -110]]):
+        values, dates = pad_series(series_values, [[d0, d1], [d0, d1, d2]])
+        with pytest.raises(AssertionError):
+            xirr_many(values, dates)
+
+    # Unsorted dates
+    values, dates = pad_series([[-100, 105], [-100, 50, 60]], [[d0, d1], [d0, d2, d1]])
+    with pytest.raises(AssertionError):
+        xirr_many(values, dates)
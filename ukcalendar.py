@@ -8,11 +8,19 @@
 import os.path
 import datetime
 
+from collections.abc import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
 
 __all__ = [
     'is_business_day',
     'next_business_day',
     'prev_business_day',
+    'add_business_days',
+    'add_business_days_array',
+    'ukbusdaycalendar',
     'days_in_month',
     'ukbankholidays',
     'isukbankholiday',
@@ -26,23 +34,58 @@ def is_business_day(date:datetime.date) -> bool:
 
 
 def next_business_day(date:datetime.date) -> datetime.date:
-    delta = [1, 1, 1, 1, 3, 2, 1]
-    while True:
-        days = delta[date.weekday()]
-        date = date + datetime.timedelta(days=days)
-        if not isukbankholiday(date):
-            return date
+    return add_business_days(date, 1)
 
 
 def prev_business_day(date:datetime.date) -> datetime.date:
-    delta = [3, 1, 1, 1, 1, 1, 2]
+    return add_business_days(date, -1)
+
+
+def add_business_days(date:datetime.date, n:int) -> datetime.date:
+    """Shift date by n business days (forward if n > 0, backward if n < 0)."""
+
+    i = date.toordinal() - _ordinal_min
+    if n == 0:
+        return date
+    elif 0 <= i < len(_business_days_before) - 1:
+        if n > 0:
+            k = _business_days_before[i + 1] + n - 1
+        else:
+            k = _business_days_before[i] + n
+        if 0 <= k < len(_business_day_ordinals):
+            return datetime.date.fromordinal(_business_day_ordinals[k])
+
+    # Outside of the table, step one business day at a time
+    if n > 0:
+        for _ in range(n):
+            date = _step_business_day(date, [1, 1, 1, 1, 3, 2, 1], 1)
+    else:
+        for _ in range(-n):
+            date = _step_business_day(date, [3, 1, 1, 1, 1, 1, 2], -1)
+    return date
+
+
+def _step_business_day(date:datetime.date, delta:list[int], sign:int) -> datetime.date:
     while True:
         days = delta[date.weekday()]
-        date = date - datetime.timedelta(days=days)
+        date = date + datetime.timedelta(days=sign*days)
         if not isukbankholiday(date):
             return date
 
 
+def add_business_days_array(dates:Sequence[datetime.date]|np.ndarray, n:npt.ArrayLike) -> np.ndarray:
+    """Vectorized equivalent of add_business_days for datetime64[D] arrays."""
+
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    n = np.asarray(n, dtype=np.int64)
+
+    # Roll non-business days towards the direction opposite to the shift, so
+    # that the first step lands on the adjacent business day.
+    forward = np.busday_offset(dates, n, roll='backward', busdaycal=ukbusdaycalendar)
+    backward = np.busday_offset(dates, n, roll='forward', busdaycal=ukbusdaycalendar)
+    return np.where(n > 0, forward, np.where(n < 0, backward, dates))
+
+
 _days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
 
 def days_in_month(year:int, month:int) -> int:
@@ -87,6 +130,25 @@ def _read() -> set[tuple[int, int, int]]:
 ukbankholidays = _read()
 
 
+ukbusdaycalendar = np.busdaycalendar(holidays=np.array(sorted(datetime.date(*ymd) for ymd in ukbankholidays), dtype='datetime64[D]'))
+
+
+# Business day ordinal table, covering all years in ukbankholidays.csv, where
+# _business_days_before[i] is the number of business days strictly before
+# ordinal _ordinal_min + i.
+def _table() -> tuple[int, list[int], list[int]]:
+    first = datetime.date(min(ukbankholidays)[0], 1, 1)
+    last = datetime.date(max(ukbankholidays)[0], 12, 31)
+    dates = np.arange(np.datetime64(first, 'D'), np.datetime64(last, 'D') + np.timedelta64(1, 'D'))
+    business = np.is_busday(dates, busdaycal=ukbusdaycalendar)
+    ordinals = np.arange(first.toordinal(), last.toordinal() + 1)
+    business_days_before = np.concatenate(([0], np.cumsum(business)))
+    return first.toordinal(), ordinals[business].tolist(), business_days_before.tolist()
+
+
+_ordinal_min, _business_day_ordinals, _business_days_before = _table()
+
+
 def main() -> None:
     """Generate ukbankholidays.csv."""
 
@@ -19,6 +19,9 @@ import scipy.optimize  # type: ignore[import-untyped]
 __all__ = [
     'xnpv',
     'xirr',
+    'xnpv_many',
+    'xirr_many',
+    'pad_series',
 ]
 
 
@@ -72,3 +75,94 @@ def xirr(values:Sequence[SupportsFloat], dates:Sequence[datetime.date], guess:fl
         df = scipy.optimize.brentq(fn, 1e-6, 1e6)
 
     return 1.0 / df - 1.0
+
+
+def pad_series(series_values:Sequence[Sequence[SupportsFloat]], series_dates:Sequence[Sequence[datetime.date]]) -> tuple[np.ndarray, np.ndarray]:
+    '''Stack several cash flow series into zero/NaT padded 2-D arrays.'''
+    assert len(series_values) == len(series_dates)
+    width = max([len(values) for values in series_values], default=0)
+    values_array = np.zeros((len(series_values), width), dtype=np.float64)
+    dates_array = np.full((len(series_dates), width), np.datetime64('NaT', 'D'), dtype='datetime64[D]')
+    for i, (values, dates) in enumerate(zip(series_values, series_dates)):
+        assert len(values) == len(dates)
+        values_array[i, :len(values)] = values
+        dates_array[i, :len(dates)] = dates
+    return values_array, dates_array
+
+
+def _periods_many(dates:np.ndarray, period:float) -> np.ndarray:
+    dates_array = np.asarray(dates, dtype='datetime64[D]')
+    assert dates_array.ndim == 2
+    padding = np.isnat(dates_array)
+    assert ((dates_array[:, :-1] <= dates_array[:, 1:]) | padding[:, :-1] | padding[:, 1:]).all()
+    periods = (dates_array - dates_array[:, :1]) / np.timedelta64(1, 'D')
+    periods[padding] = 0.0
+    periods /= period
+    return periods
+
+
+def xnpv_many(rates:float|np.ndarray, values:np.ndarray, dates:np.ndarray, period:float=365.25) -> np.ndarray:
+    '''Vectorized xnpv over the rows of padded 2-D values/dates arrays.'''
+    values_array = np.asarray(values, dtype=np.float64)
+    periods = _periods_many(dates, period)
+    discount_factor = 1.0 / (1.0 + np.asarray(rates, dtype=np.float64))
+    discount_factor = np.broadcast_to(discount_factor, values_array.shape[:1])
+    return (values_array * discount_factor[:, np.newaxis] ** periods).sum(axis=1)
+
+
+def xirr_many(values:np.ndarray, dates:np.ndarray, guess:float=0.1, period:float=365.25, tol:float=1.48e-8, maxiter:int=50) -> np.ndarray:
+    '''Vectorized xirr over the rows of padded 2-D values/dates arrays.
+
+    Padding entries must have zero values.  Series without a solution yield NaN.'''
+
+    values_array = np.asarray(values, dtype=np.float64)
+    assert values_array.ndim == 2
+    padding = np.isnat(np.asarray(dates, dtype='datetime64[D]'))
+    assert (np.where(padding, np.inf, values_array).min(axis=1, initial=np.inf) <= 0.0).all()
+    assert (np.where(padding, -np.inf, values_array).max(axis=1, initial=-np.inf) >= 0.0).all()
+
+    periods = _periods_many(dates, period)
+    assert periods.shape == values_array.shape
+
+    def fn(df:np.ndarray, rows:np.ndarray) -> np.ndarray:
+        return (values_array[rows] * df[:, np.newaxis] ** periods[rows]).sum(axis=1)
+
+    # Newton iteration on all series at once, masking off converged ones
+    df = np.full(values_array.shape[0], 1.0 / (1.0 + guess))
+    converged = np.zeros(values_array.shape[0], dtype=bool)
+    active = np.arange(values_array.shape[0])
+    for _ in range(maxiter):
+        if not active.size:
+            break
+        dfa = df[active, np.newaxis]
+        terms = values_array[active] * dfa ** periods[active]
+        fn_value = terms.sum(axis=1)
+        fn_prime = (terms * periods[active]).sum(axis=1) / dfa[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = fn_value / fn_prime
+        df[active] -= step
+        done = np.abs(step) < tol
+        converged[active[done]] = True
+        # Give up on series that diverged
+        active = active[~done & (df[active] > 0.0) & np.isfinite(df[active])]
+
+    # Fallback to bisection, equivalent to xirr's brentq fallback
+    # https://stackoverflow.com/a/33260133
+    converged &= df > 0.0
+    rows = np.flatnonzero(~converged)
+    if rows.size:
+        lo = np.full(rows.size, 1e-6)
+        hi = np.full(rows.size, 1e6)
+        fn_lo = fn(lo, rows)
+        fn_hi = fn(hi, rows)
+        bracketed = np.sign(fn_lo) != np.sign(fn_hi)
+        # The interval spans many orders of magnitude, so bisect the logarithm
+        for _ in range(128):
+            mid = np.sqrt(lo * hi)
+            fn_mid = fn(mid, rows)
+            lower = np.sign(fn_mid) == np.sign(fn_lo)
+            lo = np.where(lower, mid, lo)
+            hi = np.where(lower, hi, mid)
+        df[rows] = np.where(bracketed, np.sqrt(lo * hi), np.nan)
+
+    return 1.0 / df - 1.0